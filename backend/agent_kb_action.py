@@ -17,6 +17,15 @@ import json
 import boto3
 import os
 import logging
+import re
+import hashlib
+import hmac
+import itertools
+import functools
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from urllib.parse import quote
 from botocore.exceptions import ClientError
 from botocore.config import Config
 
@@ -32,51 +41,108 @@ S3_BUCKET = os.environ.get("S3_BUCKET", "doctoknow-seigi25-data")
 config = Config(
     connect_timeout=int(os.environ.get("HTTP_CONNECT_TIMEOUT", "10")),
     read_timeout=int(os.environ.get("HTTP_READ_TIMEOUT", "60")),
-    retries={'max_attempts': int(os.environ.get("HTTP_RETRIES", "3"))}
+    retries={
+        'max_attempts': int(os.environ.get("HTTP_RETRIES", "3")),
+        'mode': os.environ.get("HTTP_RETRY_MODE", "adaptive")
+    },
+    tcp_keepalive=True,
+    max_pool_connections=max(20, int(os.environ.get("HTTP_POOL", "20")))
 )
 
-# Lazy-create Bedrock client
-_bedrock_agent_runtime = None
+# Initialize AWS clients at module scope so warm invocations reuse them
+bedrock_agent_runtime = boto3.client(
+    "bedrock-agent-runtime",
+    region_name=BEDROCK_REGION,
+    config=config
+)
 
+KNOWLEDGE_URI_PREFIX = f"s3://{S3_BUCKET}/Knowledge/"
 
-def get_bedrock_client():
-    """Lazy-create Bedrock Agent Runtime client"""
-    global _bedrock_agent_runtime
-    if _bedrock_agent_runtime is None:
-        _bedrock_agent_runtime = boto3.client(
-            "bedrock-agent-runtime", 
-            region_name=BEDROCK_REGION, 
-            config=config
-        )
-    return _bedrock_agent_runtime
+# Presigned URLs are signed locally (SigV4 query-string auth) for GET on S3_BUCKET
+S3_PRESIGN_HOST = f"{S3_BUCKET}.s3.{BEDROCK_REGION}.amazonaws.com"
+_credentials = boto3.session.Session().get_credentials()
+
+# Filter pair validation: job_id is YYYYMMDDhhmmss, folder_path must not be an
+# unresolved template ({{session.xxx}}) or contain control characters
+JOB_ID_PATTERN = re.compile(r'\d{14}')
+FOLDER_PATH_PATTERN = re.compile(r'[^\x00-\x1f{}]+')
+
+# Unresolved Agent template variable passed as a parameter value (e.g. {{session.folder_job_pairs}})
+SESSION_TEMPLATE_PATTERN = re.compile(r'\{\{session\.[^}]+\}\}')
+
+# Compact JSON for response bodies (the body is passed to the Agent model as-is)
+JSON_SEPARATORS = (',', ':')
+
+# Warm-container cache of KB results: (query, sorted folder/job pairs) -> (timestamp, answer, sources)
+# Entries expire after RETRIEVAL_CACHE_TTL seconds: files uploaded to an existing job_id
+# are ingested by KB sync, so the knowledge behind a pair can change
+RETRIEVAL_CACHE_SIZE = int(os.environ.get("RETRIEVAL_CACHE_SIZE", "64"))
+RETRIEVAL_CACHE_TTL = int(os.environ.get("RETRIEVAL_CACHE_TTL", "60"))
+_retrieval_cache = OrderedDict()
 
 
-def generate_presigned_url(s3_key, expiration=3600):
+def _hmac_sha256(key, msg):
+    return hmac.new(key, msg.encode('utf-8'), hashlib.sha256).digest()
+
+
+@functools.lru_cache(maxsize=4)
+def _derive_signing_key(secret_key, date_stamp):
+    """SigV4 signing key for S3 in BEDROCK_REGION; valid for the whole UTC day."""
+    signing_key = _hmac_sha256(f"AWS4{secret_key}".encode('utf-8'), date_stamp)
+    signing_key = _hmac_sha256(signing_key, BEDROCK_REGION)
+    signing_key = _hmac_sha256(signing_key, 's3')
+    return _hmac_sha256(signing_key, 'aws4_request')
+
+
+def generate_presigned_urls(s3_keys, expiration=3600):
     """
-    Generate a presigned URL for S3 object
+    Generate presigned GET URLs for multiple S3 objects in one pass.
+    
+    Signs with SigV4 directly instead of boto3's generate_presigned_url. The
+    signing key is derived once per day and credentials, and the canonical
+    query string once per batch, so each URL costs one SHA-256 and one HMAC.
     
     Args:
-        s3_key: S3 key (e.g., "PDF/生技資料/生技25/MCステータライン/filename.pdf")
+        s3_keys: List of S3 keys
         expiration: URL expiration time in seconds (default: 1 hour)
     
     Returns:
-        Presigned URL string or None if error
+        List of presigned URL strings in the same order as s3_keys
     """
-    try:
-        s3_client = boto3.client('s3', region_name=BEDROCK_REGION)
-        presigned_url = s3_client.generate_presigned_url(
-            'get_object',
-            Params={
-                'Bucket': S3_BUCKET,
-                'Key': s3_key
-            },
-            ExpiresIn=expiration
+    credentials = _credentials.get_frozen_credentials()
+    amz_date = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    date_stamp = amz_date[:8]
+    scope = f"{date_stamp}/{BEDROCK_REGION}/s3/aws4_request"
+    
+    signing_key = _derive_signing_key(credentials.secret_key, date_stamp)
+    
+    query_params = {
+        'X-Amz-Algorithm': 'AWS4-HMAC-SHA256',
+        'X-Amz-Credential': f"{credentials.access_key}/{scope}",
+        'X-Amz-Date': amz_date,
+        'X-Amz-Expires': str(expiration),
+        'X-Amz-SignedHeaders': 'host'
+    }
+    if credentials.token:
+        query_params['X-Amz-Security-Token'] = credentials.token
+    canonical_query = '&'.join(
+        f"{name}={quote(value, safe='')}" for name, value in sorted(query_params.items())
+    )
+    
+    presigned_urls = []
+    for s3_key in s3_keys:
+        canonical_uri = '/' + quote(s3_key, safe='/')
+        canonical_request = f"GET\n{canonical_uri}\n{canonical_query}\nhost:{S3_PRESIGN_HOST}\n\nhost\nUNSIGNED-PAYLOAD"
+        string_to_sign = (
+            f"AWS4-HMAC-SHA256\n{amz_date}\n{scope}\n"
+            f"{hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()}"
         )
-        logger.info(f"[Agent Action] Generated presigned URL for: {s3_key}")
-        return presigned_url
-    except ClientError as e:
-        logger.error(f"[Agent Action] Error generating presigned URL for {s3_key}: {e}")
-        return None
+        signature = hmac.new(signing_key, string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
+        presigned_urls.append(
+            f"https://{S3_PRESIGN_HOST}{canonical_uri}?{canonical_query}&X-Amz-Signature={signature}"
+        )
+    
+    return presigned_urls
 
 
 def extract_job_id_and_pdf_from_uri(source_uri):
@@ -86,10 +152,8 @@ def extract_job_id_and_pdf_from_uri(source_uri):
     Returns: (job_id, pdf_filename.pdf)
     """
     try:
-        prefix = f"s3://{S3_BUCKET}/Knowledge/"
-        
-        if source_uri.startswith(prefix):
-            path = source_uri.replace(prefix, "")
+        if source_uri.startswith(KNOWLEDGE_URI_PREFIX):
+            path = source_uri[len(KNOWLEDGE_URI_PREFIX):]
         else:
             path = source_uri.split("/Knowledge/", 1)[-1]
         
@@ -98,7 +162,10 @@ def extract_job_id_and_pdf_from_uri(source_uri):
         if len(parts) == 2:
             job_id = parts[0]
             txt_filename = parts[1].split("/")[-1]
-            pdf_filename = txt_filename.replace(".txt", ".pdf")
+            if txt_filename.endswith(".txt"):
+                pdf_filename = txt_filename[:-4] + ".pdf"
+            else:
+                pdf_filename = txt_filename
             return job_id, pdf_filename
         
         logger.warning(f"Could not extract job_id and filename from URI: {source_uri}")
@@ -108,128 +175,206 @@ def extract_job_id_and_pdf_from_uri(source_uri):
         return None, None
 
 
-def query_knowledge_base_with_filter(query, folder_path_job_id_pairs):
+@functools.lru_cache(maxsize=128)
+def _build_filter(folder_path_job_id_pairs):
     """
-    Query Knowledge Base with folder_path and job_id filtering.
+    Build the KB metadata filter for a set of folder/job pairs.
+    
+    Cached because a chat session queries the same pairs on every turn.
+    The returned dict is shared between calls and must not be mutated.
     
     Args:
-        query: Search query text
-        folder_path_job_id_pairs: List of tuples [("folder1", "job1"), ("folder2", "job2")]
+        folder_path_job_id_pairs: Sorted tuple of (folder_path, job_id) tuples
     
     Returns:
-        (answer, sources)
+        Bedrock retrieval filter dict
     """
-    logger.info(f"[Agent Action] Querying KB with {len(folder_path_job_id_pairs)} folder/job pairs")
+    # Build metadata filter: one branch per folder, with its job_ids combined into an `in` predicate
+    job_ids_by_folder = {}
+    for folder_path, job_id in folder_path_job_id_pairs:
+        job_ids = job_ids_by_folder.setdefault(folder_path, [])
+        if job_id not in job_ids:
+            job_ids.append(job_id)
     
-    try:
-        # Build metadata filter
-        if len(folder_path_job_id_pairs) == 1:
-            folder_path, job_id = folder_path_job_id_pairs[0]
-            filter_config = {
-                'andAll': [
-                    {'equals': {'key': 'folder_path', 'value': folder_path}},
-                    {'equals': {'key': 'job_id', 'value': job_id}}
-                ]
-            }
+    filter_conditions = []
+    for folder_path, job_ids in job_ids_by_folder.items():
+        if len(job_ids) == 1:
+            job_condition = {'equals': {'key': 'job_id', 'value': job_ids[0]}}
         else:
-            filter_conditions = []
-            for folder_path, job_id in folder_path_job_id_pairs:
-                filter_conditions.append({
-                    'andAll': [
-                        {'equals': {'key': 'folder_path', 'value': folder_path}},
-                        {'equals': {'key': 'job_id', 'value': job_id}}
-                    ]
-                })
-            filter_config = {'orAll': filter_conditions}
-        
-        logger.info(f"[Agent Action] Filter config: {json.dumps(filter_config, ensure_ascii=False)}")
-
-        # Retrieval configuration with reranking
-        retrieval_config = {
-            'vectorSearchConfiguration': {
-                'numberOfResults': 80,
-                'overrideSearchType': 'HYBRID',
-                'filter': filter_config,
-                'rerankingConfiguration': {
-                    'type': 'BEDROCK_RERANKING_MODEL',
-                    'bedrockRerankingConfiguration': {
-                        'numberOfRerankedResults': 20,  # リランキング後の結果数 (正しいパラメータ名)
-                        'modelConfiguration': {
-                            'modelArn': 'arn:aws:bedrock:us-west-2::foundation-model/cohere.rerank-v3-5:0'
-                        }
+            job_condition = {'in': {'key': 'job_id', 'value': job_ids}}
+        filter_conditions.append({
+            'andAll': [
+                {'equals': {'key': 'folder_path', 'value': folder_path}},
+                job_condition
+            ]
+        })
+    
+    if len(filter_conditions) == 1:
+        filter_config = filter_conditions[0]
+    else:
+        filter_config = {'orAll': filter_conditions}
+    
+    logger.info(f"[Agent Action] Filter config: {json.dumps(filter_config, ensure_ascii=False)}")
+    return filter_config
+
+
+def _retrieve_and_generate(query, folder_path_job_id_pairs):
+    """
+    Call retrieve_and_generate and extract unique sources.
+    
+    Args:
+        query: Search query text
+        folder_path_job_id_pairs: Sorted tuple of (folder_path, job_id) tuples
+    
+    Returns:
+        (answer, ((s3_key, file_name), ...))
+    """
+    filter_config = _build_filter(folder_path_job_id_pairs)
+    
+    # Retrieval configuration with reranking
+    retrieval_config = {
+        'vectorSearchConfiguration': {
+            'numberOfResults': 80,
+            'overrideSearchType': 'HYBRID',
+            'filter': filter_config,
+            'rerankingConfiguration': {
+                'type': 'BEDROCK_RERANKING_MODEL',
+                'bedrockRerankingConfiguration': {
+                    'numberOfRerankedResults': 20,  # リランキング後の結果数 (正しいパラメータ名)
+                    'modelConfiguration': {
+                        'modelArn': 'arn:aws:bedrock:us-west-2::foundation-model/cohere.rerank-v3-5:0'
                     }
                 }
             }
         }
+    }
 
-        # Orchestration configuration
-        orchestration_config = {
-            'queryTransformationConfiguration': {
-                'type': 'QUERY_DECOMPOSITION'
-            }
+    # Orchestration configuration
+    orchestration_config = {
+        'queryTransformationConfiguration': {
+            'type': 'QUERY_DECOMPOSITION'
         }
+    }
 
-        # Call Bedrock KB
-        bedrock_client = get_bedrock_client()
-
-        kb_config = {
-            'type': 'KNOWLEDGE_BASE',
-            'knowledgeBaseConfiguration': {
-                'knowledgeBaseId': KNOWLEDGE_BASE_ID,
-                'modelArn': BEDROCK_MODEL_ARN,
-                'retrievalConfiguration': retrieval_config,
-                'orchestrationConfiguration': orchestration_config
-            }
+    # Call Bedrock KB
+    kb_config = {
+        'type': 'KNOWLEDGE_BASE',
+        'knowledgeBaseConfiguration': {
+            'knowledgeBaseId': KNOWLEDGE_BASE_ID,
+            'modelArn': BEDROCK_MODEL_ARN,
+            'retrievalConfiguration': retrieval_config,
+            'orchestrationConfiguration': orchestration_config
         }
+    }
+    
+    response = bedrock_agent_runtime.retrieve_and_generate(
+        input={'text': query},
+        retrieveAndGenerateConfiguration=kb_config
+    )
+
+    # Extract answer and sources
+    answer = response.get('output', {}).get('text', '')
+    # Collect unique sources keyed by s3Key (first occurrence wins)
+    unique_sources = {}
+    
+    retrieved_refs = itertools.chain.from_iterable(
+        citation.get('retrievedReferences', []) for citation in response.get('citations', [])
+    )
+    for ref in retrieved_refs:
+        location = ref.get('location', {})
+        s3_location = location.get('s3Location', {})
+        source_uri = s3_location.get('uri', '')
         
-        response = bedrock_client.retrieve_and_generate(
-            input={'text': query},
-            retrieveAndGenerateConfiguration=kb_config
-        )
+        metadata = ref.get('metadata', {})
+        
+        file_name = metadata.get('FileName')
+        file_s3_key = metadata.get('s3Key')
+        
+        # Fallback extraction
+        if not file_name or not file_s3_key:
+            if source_uri:
+                job_id_extracted, extracted_file_name = extract_job_id_and_pdf_from_uri(source_uri)
+                if not file_name:
+                    file_name = extracted_file_name
+                if not file_s3_key and job_id_extracted:
+                    file_s3_key = f"PDF/{job_id_extracted}/{extracted_file_name}"
+        
+        # Avoid duplicates
+        if file_name and file_s3_key and file_s3_key not in unique_sources:
+            unique_sources[file_s3_key] = file_name
+    
+    return answer, tuple(unique_sources.items())
 
-        # Extract answer and sources
-        answer = response.get('output', {}).get('text', '')
-        sources = []
+
+def query_knowledge_base_with_filter(query, folder_path_job_id_pairs):
+    """
+    Query Knowledge Base with folder_path and job_id filtering.
+    
+    Args:
+        query: Search query text
+        folder_path_job_id_pairs: List of tuples [("folder1", "job1"), ("folder2", "job2")]
+    
+    Returns:
+        (answer, sources)
+    """
+    # Skip the KB round trip entirely for empty or malformed filters
+    valid_pairs = [
+        (folder_path, job_id)
+        for folder_path, job_id in folder_path_job_id_pairs
+        if FOLDER_PATH_PATTERN.fullmatch(folder_path) and JOB_ID_PATTERN.fullmatch(job_id)
+    ]
+    if len(valid_pairs) < len(folder_path_job_id_pairs):
+        logger.warning(f"[Agent Action] Skipped {len(folder_path_job_id_pairs) - len(valid_pairs)} invalid folder/job pairs")
+    if not valid_pairs:
+        logger.warning("[Agent Action] No valid folder/job pairs, skipping KB query")
+        return '', []
+    folder_path_job_id_pairs = valid_pairs
+    
+    logger.info(f"[Agent Action] Querying KB with {len(folder_path_job_id_pairs)} folder/job pairs")
+    
+    try:
+        # Repeated queries for the same (folder_path, job_id) pairs within RETRIEVAL_CACHE_TTL
+        # reuse the previous result. Presigned URLs expire and are always generated fresh.
+        cache_key = (query, tuple(sorted(folder_path_job_id_pairs)))
+        cached = _retrieval_cache.get(cache_key)
+        now = time.monotonic()
         
-        if 'citations' in response:
-            for citation in response['citations']:
-                retrieved_refs = citation.get('retrievedReferences', [])
-                for ref in retrieved_refs:
-                    location = ref.get('location', {})
-                    s3_location = location.get('s3Location', {})
-                    source_uri = s3_location.get('uri', '')
-                    
-                    metadata = ref.get('metadata', {})
-                    
-                    file_name = metadata.get('FileName')
-                    file_s3_key = metadata.get('s3Key')
-                    
-                    # Fallback extraction
-                    if not file_name or not file_s3_key:
-                        if source_uri:
-                            job_id_extracted, extracted_file_name = extract_job_id_and_pdf_from_uri(source_uri)
-                            if not file_name:
-                                file_name = extracted_file_name
-                            if not file_s3_key and job_id_extracted:
-                                file_s3_key = f"PDF/{job_id_extracted}/{extracted_file_name}"
-                    
-                    if file_name and file_s3_key:
-                        # Generate presigned URL for S3 object
-                        presigned_url = generate_presigned_url(file_s3_key)
-                        
-                        source_entry = {
-                            'fileName': file_name,
-                            's3Key': file_s3_key
-                        }
-                        
-                        # Add presigned URL if successfully generated
-                        if presigned_url:
-                            source_entry['presignedUrl'] = presigned_url
-                        
-                        # Avoid duplicates
-                        if not any(s.get('s3Key') == file_s3_key for s in sources):
-                            sources.append(source_entry)
-                            logger.info(f"[Agent Action] Added source: {file_name}")
+        if cached is not None and now - cached[0] < RETRIEVAL_CACHE_TTL:
+            _retrieval_cache.move_to_end(cache_key)
+            _, answer, unique_sources = cached
+            logger.info("[Agent Action] Using cached KB result")
+        else:
+            answer, unique_sources = _retrieve_and_generate(*cache_key)
+            
+            # Results without sources are not cached (knowledge may still be ingesting)
+            if unique_sources:
+                _retrieval_cache[cache_key] = (now, answer, unique_sources)
+                _retrieval_cache.move_to_end(cache_key)
+                if len(_retrieval_cache) > RETRIEVAL_CACHE_SIZE:
+                    _retrieval_cache.popitem(last=False)
+        
+        # Generate presigned URLs for all sources in a single signing batch
+        sources = []
+        if unique_sources:
+            s3_keys = [file_s3_key for file_s3_key, _ in unique_sources]
+            try:
+                presigned_urls = generate_presigned_urls(s3_keys)
+            except Exception as e:
+                logger.error(f"[Agent Action] Error generating presigned URLs: {e}")
+                presigned_urls = [None] * len(s3_keys)
+            
+            for (file_s3_key, file_name), presigned_url in zip(unique_sources, presigned_urls):
+                source_entry = {
+                    'fileName': file_name,
+                    's3Key': file_s3_key
+                }
+                
+                # Add presigned URL if successfully generated
+                if presigned_url:
+                    source_entry['presignedUrl'] = presigned_url
+                
+                sources.append(source_entry)
+                logger.info(f"[Agent Action] Added source: {source_entry['fileName']}")
         
         logger.info(f"[Agent Action] Query completed: answer_length={len(answer)}, sources={len(sources)}")
         return answer, sources
@@ -261,7 +406,8 @@ def lambda_handler(event, context):
     }
     """
     
-    logger.info(f"[Agent Action] Event: {json.dumps(event)}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("[Agent Action] Event: %s", json.dumps(event, ensure_ascii=False))
     
     try:
         # Extract parameters from Agent event
@@ -269,18 +415,18 @@ def lambda_handler(event, context):
         function = event.get('function', '')
         parameters = event.get('parameters', [])
         
-        # Parse parameters
-        param_dict = {}
-        for param in parameters:
-            param_name = param.get('name', '')
-            param_value = param.get('value', '')
-            param_dict[param_name] = param_value
+        # Parse parameters (only the ones this action uses)
+        param_dict = {
+            param['name']: param.get('value', '')
+            for param in parameters
+            if param.get('name') in ('query', 'folder_job_pairs')
+        }
         
         query = param_dict.get('query', '').strip()
         folder_job_pairs_str = param_dict.get('folder_job_pairs', '').strip()
         
         # If folder_job_pairs is a template variable like {{session.xxx}}, get from sessionAttributes
-        if folder_job_pairs_str.startswith('{{session.') and folder_job_pairs_str.endswith('}}'):
+        if SESSION_TEMPLATE_PATTERN.fullmatch(folder_job_pairs_str):
             logger.info(f"[Agent Action] Detected template variable: {folder_job_pairs_str}, retrieving from sessionAttributes")
             session_attributes = event.get('sessionAttributes', {})
             folder_job_pairs_str = session_attributes.get('folder_job_pairs', '').strip()
@@ -342,7 +488,7 @@ def lambda_handler(event, context):
                 'functionResponse': {
                     'responseBody': {
                         'TEXT': {
-                            'body': json.dumps(response_body, ensure_ascii=False)
+                            'body': json.dumps(response_body, ensure_ascii=False, separators=JSON_SEPARATORS)
                         }
                     }
                 }
@@ -368,7 +514,7 @@ def lambda_handler(event, context):
                                 'error': str(e),
                                 'answer': 'エラーが発生しました。管理者に連絡してください。',
                                 'sources': []
-                            }, ensure_ascii=False)
+                            }, ensure_ascii=False, separators=JSON_SEPARATORS)
                         }
                     }
                 }
@@ -9,6 +9,7 @@ Environment Variables:
     - KNOWLEDGE_BASE_ID: The ID of the Bedrock Knowledge Base
     - DATA_SOURCE_ID: The ID of the Data Source (S3 bucket)
     - DYNAMODB_TABLE: DynamoDB table for job status
+    - DYNAMODB_FOLDER_CONFIG_TABLE: DynamoDB table for folder registration
     - AWS_REGION: AWS region
 
 Input from Step Functions:
@@ -16,17 +17,20 @@ Input from Step Functions:
         "job_id": "string",
         "trigger_kb_sync": true (only when this is the final file)
     }
+
+The state machine's CheckIfLastFile Choice state routes only files with
+trigger_kb_sync=true to TriggerKBSync, so this Lambda is not invoked for
+the other files in a batch.
 """
 
 import json
 import logging
 import os
 import boto3
+from boto3.dynamodb.types import TypeSerializer
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
-# Initialize AWS clients
-bedrock_kb_client = boto3.client('bedrock-agent')
-dynamodb = boto3.resource('dynamodb')
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
@@ -34,23 +38,39 @@ logger.setLevel(logging.INFO)
 KNOWLEDGE_BASE_ID = os.environ.get('KNOWLEDGE_BASE_ID')
 DATA_SOURCE_ID = os.environ.get('DATA_SOURCE_ID')
 DYNAMODB_TABLE = os.environ.get('DYNAMODB_TABLE')
+DYNAMODB_FOLDER_CONFIG_TABLE = os.environ.get('DYNAMODB_FOLDER_CONFIG_TABLE')
 AWS_REGION = os.environ.get('AWS_REGION', 'us-east-1')
 
+config = Config(
+    connect_timeout=int(os.environ.get('HTTP_CONNECT_TIMEOUT', '10')),
+    read_timeout=int(os.environ.get('HTTP_READ_TIMEOUT', '60')),
+    retries={'max_attempts': int(os.environ.get('HTTP_RETRIES', '3'))}
+)
+
+# Initialize AWS clients (low-level DynamoDB client: only simple item operations are used)
+bedrock_kb_client = boto3.client('bedrock-agent')
+dynamodb_client = boto3.client('dynamodb', region_name=AWS_REGION, config=config)
+_serializer = TypeSerializer()
+
 
 def update_dynamodb_status(job_id, status, details=None):
     """Update job status in DynamoDB"""
+    if not job_id or job_id == 'unknown':
+        logger.warning(f"Skipping DynamoDB status update to {status}: job_id not available")
+        return
+    
     try:
-        table = dynamodb.Table(DYNAMODB_TABLE)
         update_expr = 'SET #status = :status'
-        expr_values = {':status': status}
+        expr_values = {':status': {'S': status}}
         expr_names = {'#status': 'status'}
         
         if details:
             update_expr += ', kb_sync_details = :details'
-            expr_values[':details'] = details
+            expr_values[':details'] = _serializer.serialize(details)
         
-        table.update_item(
-            Key={'job_id': job_id},
+        dynamodb_client.update_item(
+            TableName=DYNAMODB_TABLE,
+            Key={'job_id': {'S': job_id}},
             UpdateExpression=update_expr,
             ExpressionAttributeNames=expr_names,
             ExpressionAttributeValues=expr_values
@@ -116,42 +136,22 @@ def register_folder_on_first_knowledge_completion(folder_path, job_id):
         bool: Success status
     """
     try:
-        # Get folder_config table name from environment
-        folder_config_table_name = os.environ.get('DYNAMODB_FOLDER_CONFIG_TABLE')
-        
-        if not folder_config_table_name:
+        if not DYNAMODB_FOLDER_CONFIG_TABLE:
             logger.warning("DYNAMODB_FOLDER_CONFIG_TABLE not configured")
             return False
         
-        folder_config_table = dynamodb.Table(folder_config_table_name)
-        
-        # Check if folder is already registered
-        response = folder_config_table.get_item(
-            Key={'folder_path': folder_path}
+        # Single upsert: default_job_id is only set on first registration,
+        # latest_job_id is always updated
+        dynamodb_client.update_item(
+            TableName=DYNAMODB_FOLDER_CONFIG_TABLE,
+            Key={'folder_path': {'S': folder_path}},
+            UpdateExpression='SET default_job_id = if_not_exists(default_job_id, :jid), latest_job_id = :jid',
+            ExpressionAttributeValues={
+                ':jid': {'S': job_id}
+            }
         )
-        
-        if 'Item' in response:
-            # Already registered - just update latest_job_id
-            folder_config_table.update_item(
-                Key={'folder_path': folder_path},
-                UpdateExpression='SET latest_job_id = :ljid',
-                ExpressionAttributeValues={
-                    ':ljid': job_id
-                }
-            )
-            logger.info(f"Folder {folder_path} already registered. Updated latest_job_id to {job_id}")
-            return True
-        else:
-            # First time - register with default_job_id
-            folder_config_table.put_item(
-                Item={
-                    'folder_path': folder_path,
-                    'default_job_id': job_id,
-                    'latest_job_id': job_id
-                }
-            )
-            logger.info(f"Registered folder {folder_path} with default_job_id: {job_id}")
-            return True
+        logger.info(f"Registered folder {folder_path} (latest_job_id: {job_id})")
+        return True
         
     except Exception as e:
         logger.error(f"Error registering folder: {e}", exc_info=True)
@@ -170,7 +170,8 @@ def lambda_handler(event, context):
         dict: Response with status and details
     """
     try:
-        logger.info(f"Received event: {json.dumps(event)}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Received event: %s", json.dumps(event, ensure_ascii=False))
         
         # Extract parameters from Step Functions
         job_id = event.get('job_id')
@@ -188,6 +189,8 @@ def lambda_handler(event, context):
                 })
             }
         
+        # Defensive only: the state machine's Choice state already skips this Lambda
+        # when trigger_kb_sync is false
         if not trigger_kb_sync:
             logger.info(f"Knowledge Base sync not triggered for job {job_id}")
             return {
@@ -16,6 +16,8 @@ logger.setLevel(logging.INFO)
 
 # メールドメイン許可リスト
 ALLOWED_EMAIL_DOMAIN = '@ad.melco.co.jp'
+# 大文字小文字を区別せずに比較するため小文字化して保持
+_ALLOWED_EMAIL_DOMAIN_LOWER = ALLOWED_EMAIL_DOMAIN.lower()
 
 
 def lambda_handler(event, context):
@@ -33,17 +35,16 @@ def lambda_handler(event, context):
         }
     }
     """
-    print(f'Event: {json.dumps(event)}')
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug('Event: %s', json.dumps(event))
     
     try:
         # ユーザーのメールアドレスを取得
         user_attributes = event['request'].get('userAttributes', {})
         user_email = user_attributes.get('email', '')
         
-        logger.info(f'Validating email: {user_email}')
-        
-        # メールドメイン検証
-        if not user_email.endswith(ALLOWED_EMAIL_DOMAIN):
+        # メールドメイン検証（大文字小文字を区別しない）
+        if not user_email.lower().endswith(_ALLOWED_EMAIL_DOMAIN_LOWER):
             logger.warning(f'Email domain not allowed: {user_email}')
             # エラーをthrowすると、トークン生成前に拒否される
             raise Exception(f'メールドメインが許可されていません。{ALLOWED_EMAIL_DOMAIN} を使用してください')
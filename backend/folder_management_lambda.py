@@ -17,16 +17,31 @@ Environment Variables:
 import json
 import logging
 import os
+import re
+import time
 import boto3
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
+from botocore.config import Config
 from botocore.exceptions import ClientError
-from folder_tree_helper import get_folder_tree
+from folder_tree_helper import get_folder_list, get_folder_tree, get_folder_tree_for_prefixes, invalidate_folder_tree_cache
 
-# Initialize AWS clients
-s3_client = boto3.client('s3')
-dynamodb = boto3.resource('dynamodb')
-lambda_client = boto3.client('lambda')
-stepfunctions_client = boto3.client('stepfunctions')
+# Shared client config: pool sized for the parallel fan-outs below, keep-alive for warm containers
+config = Config(
+    connect_timeout=int(os.environ.get('HTTP_CONNECT_TIMEOUT', '10')),
+    read_timeout=int(os.environ.get('HTTP_READ_TIMEOUT', '60')),
+    retries={'max_attempts': int(os.environ.get('HTTP_RETRIES', '3')), 'mode': 'adaptive'},
+    max_pool_connections=int(os.environ.get('HTTP_POOL_CONNECTIONS', '50')),
+    tcp_keepalive=True
+)
+
+# Initialize AWS clients (one session: credentials are resolved once for all clients)
+session = boto3.session.Session()
+s3_client = session.client('s3', config=config)
+dynamodb = session.resource('dynamodb', config=config)
+dynamodb_client = dynamodb.meta.client  # thread-safe (unlike Table), same Python-typed items
+lambda_client = session.client('lambda', config=config)
+stepfunctions_client = session.client('stepfunctions', config=config)
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -41,20 +56,78 @@ AWS_REGION = os.environ.get('AWS_REGION', 'us-west-2')
 # DynamoDB table
 folder_config_table = dynamodb.Table(DYNAMODB_FOLDER_CONFIG_TABLE) if DYNAMODB_FOLDER_CONFIG_TABLE else None
 
+# Parallel scan segments for the folder_config table
+SCAN_TOTAL_SEGMENTS = int(os.environ.get('SCAN_TOTAL_SEGMENTS', '8'))
+
+# Retries for UnprocessedKeys returned by BatchGetItem
+BATCH_GET_MAX_RETRIES = 5
+
 # JST timezone (UTC+9)
 JST = timezone(timedelta(hours=9))
 
+# Upload filename validation: 1-255 chars, no path separators, no '..' (path traversal)
+MAX_FILES_PER_REQUEST = 50
+MAX_FILENAME_LENGTH = 255
+_FILENAME_RE = re.compile(r'\A(?!.*\.\.)[^/\\]{1,%d}\Z' % MAX_FILENAME_LENGTH, re.DOTALL)
+
+# Folder marker object (PDF/{folder_path}/.folder_marker)
+FOLDER_MARKER_SUFFIX = '/.folder_marker'
+
+# Compact JSON separators for response bodies and invoke payloads
+JSON_SEPARATORS = (',', ':')
+
+# Response headers (shared by all responses, built once per container)
+CORS_HEADERS = {
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*'
+}
+
+# Registration lookups cached across warm invocations (registrations change rarely)
+# 'complete' = data came from a full Scan, so it answers for every path
+REGISTRATION_CACHE_TTL = int(os.environ.get('REGISTRATION_CACHE_TTL', '30'))
+_registration_cache = {'data': {}, 'paths': frozenset(), 'complete': False, 'ts': 0.0}
+
+
+def _dumps(obj):
+    """Serialize to compact UTF-8 JSON (Japanese text is kept as-is, not \\u-escaped)"""
+    return json.dumps(obj, ensure_ascii=False, separators=JSON_SEPARATORS)
+
+
+def json_response(status_code, body):
+    """Create a standardized API response"""
+    return {
+        'statusCode': status_code,
+        'headers': CORS_HEADERS,
+        'body': _dumps(body)
+    }
+
+
+def invalidate_registration_cache():
+    """Drop cached registration info (called after folder writes in this Lambda)"""
+    _registration_cache.update(data={}, paths=frozenset(), complete=False, ts=0.0)
+
 
-def get_folder_tree_with_registration_status():
+def _registration_cache_covers(folder_paths):
+    """True if the registration cache is fresh and answers for all of folder_paths"""
+    if time.monotonic() - _registration_cache['ts'] >= REGISTRATION_CACHE_TTL:
+        return False
+    return _registration_cache['complete'] or _registration_cache['paths'].issuperset(folder_paths)
+
+
+def get_folder_tree_with_registration_status(flat=False):
     """
     Get folder tree from S3 and enrich with registration status from DynamoDB
     
+    Args:
+        flat: If True, return the flat folder list (sorted by path, no name/children)
+              and leave building the tree to the client
+    
     Returns:
         List of folder objects with is_registered and default_job_id fields
     """
     try:
-        # Get folder tree from S3
-        folders = get_folder_tree()
+        # Get folder tree (or flat folder list) from S3
+        folders = get_folder_list() if flat else get_folder_tree()
         
         if not folder_config_table:
             logger.warning("DYNAMODB_FOLDER_CONFIG_TABLE not configured")
@@ -63,29 +136,8 @@ def get_folder_tree_with_registration_status():
                 add_registration_status(folder, {})
             return folders
         
-        # Get all registered folders from DynamoDB
-        logger.info("Fetching registered folders from DynamoDB")
-        response = folder_config_table.scan()
-        registered_folders = {}
-        
-        for item in response.get('Items', []):
-            folder_path = item.get('folder_path')
-            registered_folders[folder_path] = {
-                'default_job_id': item.get('default_job_id'),
-                'latest_job_id': item.get('latest_job_id')
-            }
-        
-        # Handle pagination
-        while 'LastEvaluatedKey' in response:
-            response = folder_config_table.scan(
-                ExclusiveStartKey=response['LastEvaluatedKey']
-            )
-            for item in response.get('Items', []):
-                folder_path = item.get('folder_path')
-                registered_folders[folder_path] = {
-                    'default_job_id': item.get('default_job_id'),
-                    'latest_job_id': item.get('latest_job_id')
-                }
+        # Look up only the folders present in the tree (BatchGetItem instead of a full Scan)
+        registered_folders = get_registered_folders(collect_folder_paths(folders))
         
         logger.info(f"Found {len(registered_folders)} registered folders")
         
@@ -100,62 +152,272 @@ def get_folder_tree_with_registration_status():
         raise
 
 
-def filter_registered_folders(folder, registered_folders):
+def collect_folder_paths(folders):
     """
-    Recursively filter folder tree to show only registered folders and their parents
+    Collect the paths of all folders in a folder tree
+    
+    Args:
+        folders: List of root folder objects
+    
+    Returns:
+        List of folder paths
+    """
+    folder_paths = []
+    stack = list(folders)
+    while stack:
+        folder = stack.pop()
+        folder_paths.append(folder['path'])
+        stack.extend(folder.get('children') or [])
+    return folder_paths
+
+
+def get_registered_folders(folder_paths):
+    """
+    Get registration info for the given folder paths from DynamoDB
+    
+    Uses BatchGetItem (100 keys per request) so the cost scales with the number
+    of folders in the tree rather than the size of the folder_config table.
+    Results are reused for REGISTRATION_CACHE_TTL seconds in a warm container.
+    
+    Args:
+        folder_paths: List of folder paths
+    
+    Returns:
+        Dict of {folder_path: {'default_job_id': ..., 'latest_job_id': ...}} for registered folders
+    """
+    # Serve from the warm-container cache when it is fresh and covers all requested paths
+    if _registration_cache_covers(folder_paths):
+        cached = _registration_cache['data']
+        return {path: cached[path] for path in folder_paths if path in cached}
+    
+    registered_folders = {}
+    
+    logger.info(f"Fetching registration status for {len(folder_paths)} folders from DynamoDB")
+    
+    for i in range(0, len(folder_paths), 100):
+        request_items = {
+            DYNAMODB_FOLDER_CONFIG_TABLE: {
+                'Keys': [{'folder_path': path} for path in folder_paths[i:i + 100]],
+                'ProjectionExpression': 'folder_path, default_job_id, latest_job_id'
+            }
+        }
+        
+        # Retry unprocessed keys (throttling) with a short, bounded backoff
+        for attempt in range(BATCH_GET_MAX_RETRIES + 1):
+            if attempt:
+                time.sleep(min(0.05 * (2 ** (attempt - 1)), 1.0))
+            response = dynamodb.batch_get_item(RequestItems=request_items)
+            
+            for item in response.get('Responses', {}).get(DYNAMODB_FOLDER_CONFIG_TABLE, []):
+                registered_folders[item['folder_path']] = {
+                    'default_job_id': item.get('default_job_id'),
+                    'latest_job_id': item.get('latest_job_id')
+                }
+            
+            request_items = response.get('UnprocessedKeys')
+            if not request_items:
+                break
+        else:
+            raise RuntimeError(
+                f"Failed to read {len(request_items[DYNAMODB_FOLDER_CONFIG_TABLE]['Keys'])} folder configs after retries"
+            )
+    
+    _registration_cache.update(
+        data=registered_folders,
+        paths=frozenset(folder_paths),
+        complete=False,
+        ts=time.monotonic()
+    )
+    return registered_folders
+
+
+def lookup_registration(folder_path):
+    """
+    Get registration info for a single folder
+    
+    Always a single projected GetItem (never the registration cache): the upload
+    path passes default_job_id on to trigger-processing, and registrations /
+    default job_ids are written by other Lambdas (job_creator), so a cached
+    value could route uploads to a stale job.
+    
+    Args:
+        folder_path: Folder path
+    
+    Returns:
+        {'default_job_id': ..., 'latest_job_id': ...} or None if not registered
+    """
+    response = folder_config_table.get_item(
+        Key={'folder_path': folder_path},
+        ProjectionExpression='default_job_id, latest_job_id'
+    )
+    item = response.get('Item')
+    if not item:
+        return None
+    return {
+        'default_job_id': item.get('default_job_id'),
+        'latest_job_id': item.get('latest_job_id')
+    }
+
+
+def _scan_folder_config_segment(segment, total_segments):
+    """Scan one segment of the folder_config table, following pagination"""
+    items = []
+    scan_params = {
+        'TableName': DYNAMODB_FOLDER_CONFIG_TABLE,
+        'Segment': segment,
+        'TotalSegments': total_segments,
+        'ProjectionExpression': 'folder_path, default_job_id, latest_job_id'
+    }
+    
+    while True:
+        response = dynamodb_client.scan(**scan_params)
+        items.extend(response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            return items
+        scan_params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def scan_registered_folders():
+    """
+    Get all registered folders with a parallel Scan of the folder_config table
+    
+    Segments are scanned concurrently (SCAN_TOTAL_SEGMENTS threads), so wall-clock
+    time no longer grows page by page with the table size.
+    
+    The result also fills the registration cache as a complete snapshot, so
+    repeated registered_only requests and later lookups in a warm container
+    do not read the table again within REGISTRATION_CACHE_TTL.
+    
+    Returns:
+        Dict of {folder_path: {'default_job_id': ..., 'latest_job_id': ...}}
+    """
+    if _registration_cache['complete'] and _registration_cache_covers(()):
+        return dict(_registration_cache['data'])
+    
+    total_segments = SCAN_TOTAL_SEGMENTS
+    with ThreadPoolExecutor(max_workers=total_segments) as executor:
+        segment_items = list(executor.map(
+            lambda segment: _scan_folder_config_segment(segment, total_segments),
+            range(total_segments)
+        ))
+    
+    registered_folders = {}
+    for items in segment_items:
+        for item in items:
+            registered_folders[item['folder_path']] = {
+                'default_job_id': item.get('default_job_id'),
+                'latest_job_id': item.get('latest_job_id')
+            }
+    
+    _registration_cache.update(
+        data=registered_folders,
+        paths=frozenset(registered_folders),
+        complete=True,
+        ts=time.monotonic()
+    )
+    return dict(registered_folders)
+
+
+def _prefixes(path):
+    """
+    Yield the path and all of its ancestor paths ('a/b/c' -> 'a', 'a/b', 'a/b/c')
+    """
+    idx = path.find('/')
+    while idx != -1:
+        yield path[:idx]
+        idx = path.find('/', idx + 1)
+    yield path
+
+
+def build_kept_paths(registered_folders):
+    """
+    Build the set of folder paths that survive registered_only filtering:
+    every registered path plus all of its ancestors
+    
+    Args:
+        registered_folders: Dict of registered folder paths
+    
+    Returns:
+        Set of folder paths
+    """
+    kept = set()
+    for folder_path in registered_folders:
+        kept.update(_prefixes(folder_path))
+    return kept
+
+
+def filter_registered_folders(folder, registered_folders, kept=None):
+    """
+    Filter folder tree to show only registered folders and their parents
     Returns the folder if it or any of its descendants are registered, None otherwise
     
+    Top-down walk that prunes every subtree whose path is not in the kept set,
+    so only kept nodes are visited. The input tree is not modified.
+    
     Args:
         folder: Folder object
         registered_folders: Dict of registered folder paths
+        kept: Precomputed build_kept_paths(registered_folders) (optional)
     
     Returns:
         Filtered folder object or None
     """
-    folder_path = folder.get('path')
-    is_registered = folder_path in registered_folders
+    if kept is None:
+        kept = build_kept_paths(registered_folders)
+    
+    if folder.get('path') not in kept:
+        return None
     
-    # Recursively filter children
-    filtered_children = []
-    if 'children' in folder and folder['children']:
-        for child in folder['children']:
-            filtered_child = filter_registered_folders(child, registered_folders)
-            if filtered_child:
-                filtered_children.append(filtered_child)
+    def copy_node(node):
+        registration = registered_folders.get(node.get('path'))
+        node_copy = node.copy()
+        node_copy['children'] = []
+        node_copy['is_registered'] = registration is not None
+        node_copy['default_job_id'] = registration.get('default_job_id') if registration else None
+        return node_copy
     
-    # Include this folder if:
-    # 1. It's registered, OR
-    # 2. It has registered descendants (parent folder case)
-    if is_registered or filtered_children:
-        folder_copy = folder.copy()
-        folder_copy['children'] = filtered_children
-        add_registration_status(folder_copy, registered_folders)
-        return folder_copy
+    root_copy = copy_node(folder)
+    visited = [(root_copy, None)]
+    stack = [(folder, root_copy)]
     
-    return None
+    while stack:
+        node, node_copy = stack.pop()
+        for child in node.get('children') or []:
+            if child.get('path') not in kept:
+                continue  # prune
+            child_copy = copy_node(child)
+            node_copy['children'].append(child_copy)
+            visited.append((child_copy, node_copy))
+            stack.append((child, child_copy))
+    
+    # 登録済みフォルダがツリー上に存在しない場合（S3から削除済み等）、
+    # その祖先だけが残らないよう、子を持たない未登録ノードを葉側から取り除く
+    for node_copy, parent_copy in reversed(visited):
+        if node_copy['is_registered'] or node_copy['children']:
+            continue
+        if parent_copy is None:
+            return None
+        parent_copy['children'].remove(node_copy)
+    
+    return root_copy
 
 
 def add_registration_status(folder, registered_folders):
     """
-    Recursively add registration status to folder and its children
+    Add registration status to folder and all its descendants (in place)
     
     Args:
         folder: Folder object
         registered_folders: Dict of registered folder paths
     """
-    folder_path = folder.get('path')
-    
-    if folder_path in registered_folders:
-        folder['is_registered'] = True
-        folder['default_job_id'] = registered_folders[folder_path].get('default_job_id')
-    else:
-        folder['is_registered'] = False
-        folder['default_job_id'] = None
+    stack = [folder]
     
-    # Recursively process children
-    if 'children' in folder and folder['children']:
-        for child in folder['children']:
-            add_registration_status(child, registered_folders)
+    while stack:
+        node = stack.pop()
+        registration = registered_folders.get(node.get('path'))
+        node['is_registered'] = registration is not None
+        node['default_job_id'] = registration.get('default_job_id') if registration else None
+        stack.extend(node.get('children') or [])
 
 
 def create_folder(folder_path):
@@ -169,17 +431,27 @@ def create_folder(folder_path):
         (success: bool, message: str)
     """
     try:
-        marker_key = f"PDF/{folder_path}/.folder_marker"
+        marker_key = f"PDF/{folder_path}{FOLDER_MARKER_SUFFIX}"
         
         logger.info(f"Creating folder marker: {marker_key}")
         
-        s3_client.put_object(
-            Bucket=S3_BUCKET,
-            Key=marker_key,
-            Body=b"",
-            ContentType="application/octet-stream"
-        )
-        
+        # 条件付きPUT: マーカーが既に存在する場合は上書きしない（リトライ等の重複作成）
+        try:
+            s3_client.put_object(
+                Bucket=S3_BUCKET,
+                Key=marker_key,
+                Body=b"",
+                ContentType="application/octet-stream",
+                IfNoneMatch="*"
+            )
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') != 'PreconditionFailed':
+                raise
+            logger.info(f"Folder marker already exists: {marker_key}")
+            return True, "フォルダを作成しました"
+        
+        invalidate_registration_cache()
+        invalidate_folder_tree_cache()
         logger.info(f"Successfully created folder: {folder_path}")
         return True, "フォルダを作成しました"
         
@@ -203,75 +475,49 @@ def delete_folder(folder_path):
         
         logger.info(f"Checking if folder can be deleted: {folder_path}")
         
-        # Check for any files in this folder and all descendants
-        # (excluding .folder_marker)
-        response = s3_client.list_objects_v2(
+        # Single listing pass: collect .folder_marker keys and stop at the first other file
+        # (this folder and all descendants)
+        marker_keys = []
+        paginator = s3_client.get_paginator('list_objects_v2')
+        pages = paginator.paginate(
             Bucket=S3_BUCKET,
-            Prefix=prefix
+            Prefix=prefix,
+            PaginationConfig={'PageSize': 1000}
         )
         
-        has_non_marker_files = False
-        if 'Contents' in response:
-            for obj in response.get('Contents', []):
-                key = obj['Key']
-                # .folder_marker は除外
-                if not key.endswith('/.folder_marker'):
-                    logger.warning(f"Found non-marker file: {key}")
-                    has_non_marker_files = True
-                    break
-        
-        # ページネーション処理
-        while 'IsTruncated' in response and response['IsTruncated']:
-            response = s3_client.list_objects_v2(
-                Bucket=S3_BUCKET,
-                Prefix=prefix,
-                ContinuationToken=response.get('NextContinuationToken')
-            )
-            if 'Contents' in response:
-                for obj in response.get('Contents', []):
-                    key = obj['Key']
-                    if not key.endswith('/.folder_marker'):
-                        logger.warning(f"Found non-marker file: {key}")
-                        has_non_marker_files = True
-                        break
-            if has_non_marker_files:
-                break
-        
-        if has_non_marker_files:
-            logger.warning(f"Folder has non-marker files: {folder_path}")
-            return False, "データが存在するため削除できません。配下のすべてのフォルダが空である必要があります。"
+        # キーのみを JMESPath で射影してストリーミング（空ページは None を返す）
+        # マーカー判定は C 実装の str.endswith で行う（jmespath のフィルタは純Pythonで2回目の列挙も必要になる）
+        for key in pages.search('Contents[].Key'):
+            if key is None:
+                continue
+            if key.endswith(FOLDER_MARKER_SUFFIX):
+                marker_keys.append(key)
+            else:
+                logger.warning(f"Found non-marker file: {key}")
+                logger.warning(f"Folder has non-marker files: {folder_path}")
+                return False, "データが存在するため削除できません。配下のすべてのフォルダが空である必要があります。"
         
         # 配下のすべての .folder_marker を削除
         logger.info(f"Deleting all .folder_marker files under {folder_path}")
-        response = s3_client.list_objects_v2(
-            Bucket=S3_BUCKET,
-            Prefix=prefix
-        )
         
-        marker_count = 0
-        if 'Contents' in response:
-            for obj in response.get('Contents', []):
-                key = obj['Key']
-                if key.endswith('/.folder_marker'):
-                    s3_client.delete_object(Bucket=S3_BUCKET, Key=key)
-                    marker_count += 1
-                    logger.info(f"Deleted marker: {key}")
-        
-        # ページネーション処理
-        while 'IsTruncated' in response and response['IsTruncated']:
-            response = s3_client.list_objects_v2(
+        # DeleteObjects で最大1000件ずつ一括削除
+        for i in range(0, len(marker_keys), 1000):
+            response = s3_client.delete_objects(
                 Bucket=S3_BUCKET,
-                Prefix=prefix,
-                ContinuationToken=response.get('NextContinuationToken')
+                Delete={
+                    'Objects': [{'Key': key} for key in marker_keys[i:i + 1000]],
+                    'Quiet': True
+                }
             )
-            if 'Contents' in response:
-                for obj in response.get('Contents', []):
-                    key = obj['Key']
-                    if key.endswith('/.folder_marker'):
-                        s3_client.delete_object(Bucket=S3_BUCKET, Key=key)
-                        marker_count += 1
-                        logger.info(f"Deleted marker: {key}")
+            errors = response.get('Errors', [])
+            if errors:
+                logger.error(f"Failed to delete {len(errors)} markers: {errors[:5]}")
+                return False, f"フォルダの削除に失敗しました: {errors[0].get('Key')} ({errors[0].get('Code')})"
         
+        marker_count = len(marker_keys)
+        
+        invalidate_registration_cache()
+        invalidate_folder_tree_cache()
         logger.info(f"Successfully deleted folder {folder_path} ({marker_count} markers deleted)")
         return True, f"フォルダを削除しました（{marker_count}個のマーカーを削除）"
         
@@ -298,17 +544,14 @@ def generate_presigned_urls(folder_path, filenames, user_id=None):
     """
     try:
         # Security: Validate file count and names
-        MAX_FILES_PER_REQUEST = 50
-        MAX_FILENAME_LENGTH = 255
-        
         if len(filenames) > MAX_FILES_PER_REQUEST:
             raise ValueError(f"Too many files. Maximum {MAX_FILES_PER_REQUEST} files per request.")
         
         for filename in filenames:
-            if len(filename) > MAX_FILENAME_LENGTH:
-                raise ValueError(f"Filename too long: {filename}")
-            # Basic sanitization - prevent path traversal
-            if '..' in filename or '/' in filename or '\\' in filename:
+            # Basic sanitization - prevent path traversal (single precompiled match)
+            if not _FILENAME_RE.match(filename):
+                if len(filename) > MAX_FILENAME_LENGTH:
+                    raise ValueError(f"Filename too long: {filename}")
                 raise ValueError(f"Invalid filename: {filename}")
         
         if user_id:
@@ -320,13 +563,11 @@ def generate_presigned_urls(folder_path, filenames, user_id=None):
         
         if folder_config_table:
             try:
-                response = folder_config_table.get_item(
-                    Key={'folder_path': folder_path}
-                )
+                registration = lookup_registration(folder_path)
                 
-                if 'Item' in response:
+                if registration:
                     is_registered = True
-                    default_job_id = response['Item'].get('default_job_id')
+                    default_job_id = registration.get('default_job_id')
                     logger.info(f"Folder {folder_path} is registered with job_id: {default_job_id}")
                 else:
                     logger.info(f"Folder {folder_path} is not registered")
@@ -334,13 +575,12 @@ def generate_presigned_urls(folder_path, filenames, user_id=None):
             except ClientError as e:
                 logger.error(f"Error checking folder registration: {e}")
         
-        # Generate presigned URLs with security constraints
-        urls = {}
-        for filename in filenames:
+        # Generate presigned URLs with security constraints (signed in parallel)
+        def presign_upload(filename):
             s3_key = f"PDF/{folder_path}/{filename}"
             
             # Security: Set file size limit (50MB max)
-            presigned_url = s3_client.generate_presigned_url(
+            return s3_client.generate_presigned_url(
                 'put_object',
                 Params={
                     'Bucket': S3_BUCKET,
@@ -350,9 +590,14 @@ def generate_presigned_urls(folder_path, filenames, user_id=None):
                 },
                 ExpiresIn=3600  # 1 hour
             )
+        
+        urls = {}
+        if filenames:
+            with ThreadPoolExecutor(max_workers=min(16, len(filenames))) as executor:
+                presigned_urls = list(executor.map(presign_upload, filenames))
             
-            urls[filename] = presigned_url
-            logger.info(f"Generated presigned URL for: {s3_key}" + (f" (user: {user_id})" if user_id else ""))
+            urls = dict(zip(filenames, presigned_urls))
+            logger.info(f"Generated {len(urls)} presigned URLs under: PDF/{folder_path}/" + (f" (user: {user_id})" if user_id else ""))
         
         return {
             'is_registered': is_registered,
@@ -409,7 +654,7 @@ def trigger_processing(folder_path, job_id, uploaded_files, processing_mode='ful
         }
         
         # Start Step Functions execution
-        execution_input_str = json.dumps(execution_input, ensure_ascii=False)
+        execution_input_str = _dumps(execution_input)
         
         response = stepfunctions_client.start_execution(
             stateMachineArn=STATE_MACHINE_ARN,
@@ -443,30 +688,31 @@ def trigger_processing_direct(folder_path, job_id, uploaded_files, processing_mo
     try:
         logger.info(f"Triggering direct processing for {len(uploaded_files)} files in {folder_path} with job_id: {job_id}, mode: {processing_mode}")
         
+        # Prepare events for worker Lambda
+        events = []
         for idx, filename in enumerate(uploaded_files):
-            file_key = f"PDF/{folder_path}/{filename}"
-            
-            # Determine if this is the last file (for KB sync trigger)
-            is_last_file = (idx == len(uploaded_files) - 1)
-            
-            # Prepare event for worker Lambda
-            event = {
+            events.append({
                 'mode': processing_mode,
                 'job_id': job_id,
                 'folder_path': folder_path,
-                'file_key': file_key,
+                'file_key': f"PDF/{folder_path}/{filename}",
                 'file_name': filename,
-                'trigger_kb_sync': is_last_file
-            }
-            
-            # Invoke worker Lambda asynchronously
+                # Determine if this is the last file (for KB sync trigger)
+                'trigger_kb_sync': idx == len(uploaded_files) - 1
+            })
+        
+        # Invoke worker Lambda asynchronously, overlapping the per-invoke round trips
+        def invoke_worker(event):
             lambda_client.invoke(
                 FunctionName=WORKER_LAMBDA_ARN,
                 InvocationType='Event',  # Asynchronous
-                Payload=json.dumps(event)
+                Payload=_dumps(event)
             )
-            
-            logger.info(f"Invoked worker Lambda for file: {filename} (KB sync: {is_last_file})")
+        
+        if events:
+            with ThreadPoolExecutor(max_workers=min(20, len(events))) as executor:
+                list(executor.map(invoke_worker, events))
+            logger.info(f"Invoked worker Lambda for {len(events)} files (KB sync: {events[-1]['file_name']})")
         
         return f"{len(uploaded_files)}個のファイルの処理を開始しました (Direct Lambda)"
         
@@ -475,6 +721,151 @@ def trigger_processing_direct(folder_path, job_id, uploaded_files, processing_mo
         raise
 
 
+def handle_get_folders(event, user_id):
+    """
+    GET /api/folders: Get folder tree with registration status
+    Query parameter: registered_only=true で登録済みフォルダのみ返す(knowledge-query.html用)
+    Query parameter: flat=true でツリーではなくパス順のフラットな一覧を返す（ツリーはクライアント側で構築）
+    
+    大きなツリーのgzip圧縮は API Gateway 側で行う（MinimumCompressionSize, Accept-Encoding 対応）
+    """
+    query_params = event.get('queryStringParameters') or {}
+    registered_only = query_params.get('registered_only', '').lower() == 'true'
+    flat = query_params.get('flat', '').lower() == 'true'
+    
+    if not registered_only:
+        return json_response(200, get_folder_tree_with_registration_status(flat=flat))
+    
+    # knowledge-query.html用: 登録済みフォルダのみ
+    logger.info("Filtering to show only registered folders")
+    
+    if not folder_config_table:
+        logger.warning("DYNAMODB_FOLDER_CONFIG_TABLE not configured, returning empty")
+        return json_response(200, [])
+    
+    # DynamoDBから登録済みフォルダを先に取得（並列Scan）し、
+    # S3は登録済みフォルダ配下のみ列挙する（未登録のサブツリーは列挙しない）
+    registered_folders = scan_registered_folders()
+    folders = get_folder_tree_for_prefixes(registered_folders.keys())
+    
+    # 登録状態を付与（S3上に存在しない登録済みパスの祖先はここで除かれる）
+    kept = build_kept_paths(registered_folders)
+    filtered_folders = []
+    for folder in folders:
+        filtered_folder = filter_registered_folders(folder, registered_folders, kept)
+        if filtered_folder:
+            filtered_folders.append(filtered_folder)
+    logger.info(f"Filtered to {len(filtered_folders)} root folders with registered descendants")
+    
+    return json_response(200, filtered_folders)
+
+
+def handle_folder_management(event, user_id):
+    """POST /api/folder-management: Create or delete folders"""
+    body = json.loads(event.get('body', '{}'))
+    action = body.get('action')
+    folder_path = body.get('folder_path')
+    
+    if not action or not folder_path:
+        return json_response(400, {
+            'error': 'Missing required parameters',
+            'message': 'action and folder_path are required'
+        })
+    
+    if action == 'create':
+        success, message = create_folder(folder_path)
+        status_code = 200 if success else 400
+        
+        return json_response(status_code, {
+            'message': message,
+            'folder_path': folder_path
+        })
+    
+    elif action == 'delete':
+        success, message = delete_folder(folder_path)
+        status_code = 200 if success else 400
+        
+        return json_response(status_code, {
+            'message': message,
+            'folder_path': folder_path
+        })
+    
+    else:
+        return json_response(400, {
+            'error': 'Invalid action',
+            'message': 'action must be "create" or "delete"'
+        })
+
+
+def handle_presigned_urls(event, user_id):
+    """GET /api/s3-presigned-urls: Generate presigned URLs for file upload"""
+    params = event.get('queryStringParameters', {})
+    folder_path = params.get('folder_path')
+    filenames_str = params.get('filenames', '')
+    
+    if not folder_path or not filenames_str:
+        return json_response(400, {
+            'error': 'Missing required parameters',
+            'message': 'folder_path and filenames are required'
+        })
+    
+    filenames = [f.strip() for f in filenames_str.split(',')]
+    
+    # Pass user_id for audit logging
+    try:
+        result = generate_presigned_urls(folder_path, filenames, user_id=user_id)
+    except ValueError as e:
+        return json_response(400, {
+            'error': 'Validation error',
+            'message': str(e)
+        })
+    
+    return json_response(200, result)
+
+
+def handle_trigger_processing(event, user_id):
+    """POST /api/trigger-processing: Trigger automatic processing"""
+    body = json.loads(event.get('body', '{}'))
+    folder_path = body.get('folder_path')
+    job_id = body.get('job_id')
+    uploaded_files = body.get('uploaded_files', [])
+    processing_mode = body.get('processing_mode', 'full')  # New parameter
+    
+    # Validate processing_mode
+    valid_modes = ['full', 'direct_pdf']
+    if processing_mode not in valid_modes:
+        return json_response(400, {
+            'error': 'Invalid processing_mode',
+            'message': f'processing_mode must be one of: {valid_modes}'
+        })
+    
+    if not all([folder_path, job_id, uploaded_files]):
+        return json_response(400, {
+            'error': 'Missing required parameters',
+            'message': 'folder_path, job_id, and uploaded_files are required'
+        })
+    
+    # アップロード完了後の呼び出し: フォルダのファイル有無が変わるため列挙キャッシュを破棄
+    invalidate_folder_tree_cache()
+    
+    message = trigger_processing(folder_path, job_id, uploaded_files, processing_mode)
+    
+    return json_response(202, {
+        'message': message,
+        'folder_path': folder_path,
+        'job_id': job_id
+    })
+
+
+# (method, path) -> route handler
+ROUTES = {
+    ('GET', '/api/folders'): handle_get_folders,
+    ('POST', '/api/folder-management'): handle_folder_management,
+    ('GET', '/api/s3-presigned-urls'): handle_presigned_urls,
+    ('POST', '/api/trigger-processing'): handle_trigger_processing,
+}
+
+
 def lambda_handler(event, context):
     """
     Main Lambda handler for folder management
@@ -486,7 +877,9 @@ def lambda_handler(event, context):
     - POST /api/trigger-processing: Trigger automatic processing
     """
     try:
-        logger.info(f"Received event: {json.dumps(event, default=str)}")
+        # イベント全体のダンプはDEBUG時のみ（INFOではメソッド/パスのみ記録）
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Received event: %s", json.dumps(event, default=str))
         
         # Extract user information from Cognito authorizer
         request_context = event.get('requestContext', {})
@@ -508,214 +901,21 @@ def lambda_handler(event, context):
         
         logger.info(f"Request: {http_method} {path}")
         
-        # Route: GET /api/folders
-        # Query parameter: registered_only=true で登録済みフォルダのみ返す(knowledge-query.html用)
-        if http_method == 'GET' and path == '/api/folders':
-            query_params = event.get('queryStringParameters') or {}
-            registered_only = query_params.get('registered_only', '').lower() == 'true'
-            
-            folders = get_folder_tree_with_registration_status()
-            
-            # knowledge-query.html用: 登録済みフォルダのみフィルタリング
-            if registered_only:
-                logger.info("Filtering to show only registered folders")
-                
-                if not folder_config_table:
-                    logger.warning("DYNAMODB_FOLDER_CONFIG_TABLE not configured, returning empty")
-                    folders = []
-                else:
-                    # DynamoDBから登録済みフォルダを取得
-                    response = folder_config_table.scan()
-                    registered_folders = {}
-                    for item in response.get('Items', []):
-                        folder_path = item.get('folder_path')
-                        registered_folders[folder_path] = {
-                            'default_job_id': item.get('default_job_id'),
-                            'latest_job_id': item.get('latest_job_id')
-                        }
-                    
-                    # ページネーション処理
-                    while 'LastEvaluatedKey' in response:
-                        response = folder_config_table.scan(
-                            ExclusiveStartKey=response['LastEvaluatedKey']
-                        )
-                        for item in response.get('Items', []):
-                            folder_path = item.get('folder_path')
-                            registered_folders[folder_path] = {
-                                'default_job_id': item.get('default_job_id'),
-                                'latest_job_id': item.get('latest_job_id')
-                            }
-                    
-                    # フォルダツリーをフィルタリング
-                    filtered_folders = []
-                    for folder in folders:
-                        filtered_folder = filter_registered_folders(folder, registered_folders)
-                        if filtered_folder:
-                            filtered_folders.append(filtered_folder)
-                    folders = filtered_folders
-                    logger.info(f"Filtered to {len(folders)} root folders with registered descendants")
-            
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps(folders, ensure_ascii=False)
-            }
-        
-        # Route: POST /api/folder-management
-        if http_method == 'POST' and path == '/api/folder-management':
-            body = json.loads(event.get('body', '{}'))
-            action = body.get('action')
-            folder_path = body.get('folder_path')
-            
-            if not action or not folder_path:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json'},
-                    'body': json.dumps({
-                        'error': 'Missing required parameters',
-                        'message': 'action and folder_path are required'
-                    }, ensure_ascii=False)
-                }
-            
-            if action == 'create':
-                success, message = create_folder(folder_path)
-                status_code = 200 if success else 400
-                
-                return {
-                    'statusCode': status_code,
-                    'headers': {'Content-Type': 'application/json'},
-                    'body': json.dumps({
-                        'message': message,
-                        'folder_path': folder_path
-                    }, ensure_ascii=False)
-                }
-            
-            elif action == 'delete':
-                success, message = delete_folder(folder_path)
-                status_code = 200 if success else 400
-                
-                return {
-                    'statusCode': status_code,
-                    'headers': {'Content-Type': 'application/json'},
-                    'body': json.dumps({
-                        'message': message,
-                        'folder_path': folder_path
-                    }, ensure_ascii=False)
-                }
-            
-            else:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json'},
-                    'body': json.dumps({
-                        'error': 'Invalid action',
-                        'message': 'action must be "create" or "delete"'
-                    }, ensure_ascii=False)
-                }
-        
-        # Route: GET /api/s3-presigned-urls
-        if http_method == 'GET' and path == '/api/s3-presigned-urls':
-            params = event.get('queryStringParameters', {})
-            folder_path = params.get('folder_path')
-            filenames_str = params.get('filenames', '')
-            
-            if not folder_path or not filenames_str:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json'},
-                    'body': json.dumps({
-                        'error': 'Missing required parameters',
-                        'message': 'folder_path and filenames are required'
-                    }, ensure_ascii=False)
-                }
-            
-            filenames = [f.strip() for f in filenames_str.split(',')]
-            
-            # Pass user_id for audit logging
-            try:
-                result = generate_presigned_urls(folder_path, filenames, user_id=user_id)
-            except ValueError as e:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json'},
-                    'body': json.dumps({
-                        'error': 'Validation error',
-                        'message': str(e)
-                    }, ensure_ascii=False)
-                }
-            
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps(result, ensure_ascii=False)
-            }
-        
-        # Route: POST /api/trigger-processing
-        if http_method == 'POST' and path == '/api/trigger-processing':
-            body = json.loads(event.get('body', '{}'))
-            folder_path = body.get('folder_path')
-            job_id = body.get('job_id')
-            uploaded_files = body.get('uploaded_files', [])
-            processing_mode = body.get('processing_mode', 'full')  # New parameter
-            
-            # Validate processing_mode
-            valid_modes = ['full', 'direct_pdf']
-            if processing_mode not in valid_modes:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json'},
-                    'body': json.dumps({
-                        'error': 'Invalid processing_mode',
-                        'message': f'processing_mode must be one of: {valid_modes}'
-                    }, ensure_ascii=False)
-                }
-            
-            if not all([folder_path, job_id, uploaded_files]):
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json'},
-                    'body': json.dumps({
-                        'error': 'Missing required parameters',
-                        'message': 'folder_path, job_id, and uploaded_files are required'
-                    }, ensure_ascii=False)
-                }
-            
-            message = trigger_processing(folder_path, job_id, uploaded_files, processing_mode)
-            
-            return {
-                'statusCode': 202,
-                'headers': {'Content-Type': 'application/json'},
-                'body': json.dumps({
-                    'message': message,
-                    'folder_path': folder_path,
-                    'job_id': job_id
-                }, ensure_ascii=False)
-            }
+        # Route dispatch（例外は下の except で 500 に変換）
+        handler = ROUTES.get((http_method, path))
+        if handler is not None:
+            return handler(event, user_id)
         
         # Unknown route
-        return {
-            'statusCode': 404,
-            'headers': {'Content-Type': 'application/json'},
-            'body': json.dumps({
-                'error': 'Not found',
-                'message': f'Route not found: {http_method} {path}'
-            }, ensure_ascii=False)
-        }
+        return json_response(404, {
+            'error': 'Not found',
+            'message': f'Route not found: {http_method} {path}'
+        })
         
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}", exc_info=True)
         
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json'},
-            'body': json.dumps({
-                'error': 'Internal server error',
-                'message': str(e)
-            }, ensure_ascii=False)
-        }
+        return json_response(500, {
+            'error': 'Internal server error',
+            'message': str(e)
+        })
@@ -3,17 +3,369 @@ Folder Tree Helper
 S3バケットからフォルダ構造を抽出
 """
 import boto3
+import json
 import os
+import re
+import sys
 import logging
+import time
+from datetime import datetime, timezone
+from itertools import repeat
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-s3_client = boto3.client('s3')
+# 並列LIST数（接続プールはそれ以上を確保）
+LIST_MAX_WORKERS = int(os.environ.get('FOLDER_LIST_MAX_WORKERS', '16'))
+
+config = Config(
+    max_pool_connections=max(32, LIST_MAX_WORKERS),
+    retries={'max_attempts': 3, 'mode': 'adaptive'},
+    tcp_keepalive=True
+)
+
+s3_client = boto3.client('s3', config=config)  # thread-safe, shared by the listing workers
 S3_BUCKET = os.environ['S3_BUCKET']
 
+# job_id（14桁の数字）のパス要素
+JOB_ID_PATTERN = re.compile(r'\d{14}')
+_is_job_id = JOB_ID_PATTERN.fullmatch
+
+# PDF/ 全体の列挙結果をウォームコンテナ内で再利用（秒）
+FOLDER_TREE_CACHE_TTL = int(os.environ.get('FOLDER_TREE_CACHE_TTL', '30'))
+_listing_cache = {'all_folders': None, 'folders_with_files': None, 'ts': 0.0}
+
+# S3上のフォルダインデックス（列挙結果のスナップショット、コンテナ間で共有）
+# 更新時は書き換えず削除する（次回の取得時に列挙し直して再作成）。最大 FOLDER_INDEX_MAX_AGE 秒で作り直す
+FOLDER_INDEX_KEY = os.environ.get('FOLDER_INDEX_KEY', 'PDF/.folder_index.json')
+FOLDER_INDEX_MAX_AGE = int(os.environ.get('FOLDER_INDEX_MAX_AGE', '300'))
+
+
+def invalidate_folder_tree_cache():
+    """フォルダ列挙キャッシュとS3上のフォルダインデックスを破棄（フォルダ作成/削除・アップロード後に呼び出す）"""
+    _listing_cache.update(all_folders=None, folders_with_files=None, ts=0.0)
+    
+    try:
+        s3_client.delete_object(Bucket=S3_BUCKET, Key=FOLDER_INDEX_KEY)
+    except ClientError as e:
+        logger.warning("Failed to delete folder index %s: %s", FOLDER_INDEX_KEY, e)
+
+
+def _load_index():
+    """
+    S3上のフォルダインデックスを読み込む
+    
+    Returns:
+        (all_folders: set, folders_with_files: set)、存在しない・古い・読めない場合は None
+    """
+    try:
+        response = s3_client.get_object(Bucket=S3_BUCKET, Key=FOLDER_INDEX_KEY)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') not in ('NoSuchKey', '404'):
+            logger.warning("Failed to read folder index %s: %s", FOLDER_INDEX_KEY, e)
+        return None
+    
+    age = (datetime.now(timezone.utc) - response['LastModified']).total_seconds()
+    if age > FOLDER_INDEX_MAX_AGE:
+        return None
+    
+    try:
+        index = json.loads(response['Body'].read())
+        return set(index['folders']), set(index['folders_with_files'])
+    except (ValueError, KeyError, TypeError) as e:
+        logger.warning("Ignoring malformed folder index %s: %s", FOLDER_INDEX_KEY, e)
+        return None
+
+
+def _save_index(all_folders, folders_with_files):
+    """列挙結果をS3上のフォルダインデックスとして保存（失敗しても処理は継続）"""
+    body = json.dumps({
+        'folders': sorted(all_folders),
+        'folders_with_files': sorted(folders_with_files)
+    }, ensure_ascii=False, separators=(',', ':'))
+    
+    try:
+        s3_client.put_object(
+            Bucket=S3_BUCKET,
+            Key=FOLDER_INDEX_KEY,
+            Body=body.encode('utf-8'),
+            ContentType='application/json'
+        )
+    except ClientError as e:
+        logger.warning("Failed to write folder index %s: %s", FOLDER_INDEX_KEY, e)
+
+
+def _get_cached_listing():
+    """有効期限内の PDF/ 全体の列挙結果 (all_folders, folders_with_files)、なければ None"""
+    if (_listing_cache['all_folders'] is not None
+            and time.monotonic() - _listing_cache['ts'] < FOLDER_TREE_CACHE_TTL):
+        return _listing_cache['all_folders'], _listing_cache['folders_with_files']
+    return None
+
+
+def _add_ancestors(folder_path, all_folders):
+    """
+    親フォルダを深い方から順に追加し、既に登録済みの親に達したら終了
+    （all_folders は常に祖先を含むため、それより上は追加済み）
+    """
+    parent_path = folder_path
+    while '/' in parent_path:
+        parent_path = parent_path.rpartition('/')[0]
+        if parent_path in all_folders:
+            break
+        all_folders.add(sys.intern(parent_path))
+
+
+def _add_keys_folders(keys, all_folders, folders_with_files):
+    """
+    オブジェクトキーからフォルダパスを抽出して集合に追加
+    
+    フォルダ検出方法:
+    1. PDFファイルから検出されるフォルダ
+    2. .folder_marker から検出されるフォルダ（新規作成時、ファイルがまだない場合）
+    """
+    # ループ内で使う名前はローカルに束縛（グローバル/属性参照を避ける）
+    is_job_id = _is_job_id
+    intern = sys.intern
+    add_folder = all_folders.add
+    mark_file = folders_with_files.add
+    add_ancestors = _add_ancestors
+    
+    for key in keys:
+        # PDF/ 直下のファイル・マーカーはフォルダを持たない（分割せずに除外）
+        if key.count('/') < 2 or not key.startswith('PDF/'):
+            continue
+        
+        # 方法1: PDFファイルから検出
+        if key.endswith('.pdf'):
+            folder_prefix = key[4:].rpartition('/')[0]  # PDF/ とファイル名を除去
+            
+            # job_id を識別（14桁の数字）してフォルダパスを抽出（最初の job_id より前）
+            parts = folder_prefix.split('/')
+            # 長さで先に除外し、14文字の要素だけ正規表現で判定
+            job_id_index = next((i for i, part in enumerate(parts) if len(part) == 14 and is_job_id(part)), len(parts))
+            if not job_id_index:
+                continue
+            
+            folder_path = intern('/'.join(parts[:job_id_index]))
+            mark_file(folder_path)  # ファイル有りとマーク
+            
+            # 既出のフォルダなら中間フォルダも追加済み（all_folders は常に祖先を含む）
+            if folder_path in all_folders:
+                continue
+            add_folder(folder_path)
+            
+            # 中間フォルダも追加
+            add_ancestors(folder_path, all_folders)
+        
+        # 方法2: .folder_marker から検出（新規作成時、ファイルがまだない場合）
+        elif key.endswith('/.folder_marker'):
+            # PDF/folder_path/.folder_marker の形式
+            folder_path = key[4:-len('/.folder_marker')]  # PDF/ と /.folder_marker を除去
+            
+            if folder_path and folder_path not in all_folders:  # 空ではない・未登録であることを確認
+                add_folder(intern(folder_path))
+                
+                # 親フォルダも追加
+                add_ancestors(folder_path, all_folders)
+
+
+def _list_level(prefix, delimiter):
+    """
+    list_objects_v2 でプレフィックス直下を列挙（ページネーション込み）
+    
+    Returns:
+        (keys: list, common_prefixes: list)
+    """
+    keys = []
+    common_prefixes = []
+    
+    # ページごとにキー文字列だけを取り出し、レスポンス（オブジェクトのメタデータ）は保持しない
+    paginator = s3_client.get_paginator('list_objects_v2')
+    pages = paginator.paginate(
+        Bucket=S3_BUCKET,
+        Prefix=prefix,
+        Delimiter=delimiter,
+        PaginationConfig={'PageSize': 1000}
+    )
+    
+    for page in pages:
+        keys.extend(obj['Key'] for obj in page.get('Contents', ()))
+        common_prefixes.extend(cp['Prefix'] for cp in page.get('CommonPrefixes', ()))
+    
+    return keys, common_prefixes
+
+
+def _list_job_id_level(prefix):
+    """
+    job_id 階層（PDF/.../<job_id>/）配下を列挙し、PDFを含むページを読んだ時点で打ち切る
+    
+    job_id 配下はフォルダではなく処理済みファイルのため、親フォルダを「ファイル有り」と
+    判定できれば十分。読んだページのキーは通常どおり判定するが、打ち切った後の
+    ページにある .folder_marker（job_id 配下のサブフォルダのマーカー）は無視される。
+    キーは辞書順で並ぶため、マーカーが先頭ページに含まれるとは限らない。
+    
+    Returns:
+        (keys: list, common_prefixes: list)  common_prefixes は常に空
+    """
+    keys = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    pages = paginator.paginate(
+        Bucket=S3_BUCKET,
+        Prefix=prefix,
+        PaginationConfig={'PageSize': 1000}
+    )
+    
+    for page in pages:
+        page_keys = [obj['Key'] for obj in page.get('Contents', ())]
+        keys.extend(page_keys)
+        if any(map(str.endswith, page_keys, repeat('.pdf'))):
+            break
+    
+    return keys, []
+
+
+def _summarize_level_keys(level_prefix, keys):
+    """
+    Delimiter='/' で列挙した1階層分のキーを、判定結果が同じになる代表キー（最大2件）に置き換える
+    
+    同じ階層のキーはすべて同じフォルダ（level_prefix）に属するため、結果は
+    「PDFがあるか」「.folder_marker があるか」だけで決まる。判定は C 実装の組み込み
+    （any/map/str.endswith と list の in）で行い、キーごとの Python 処理を行わない。
+    """
+    summary = []
+    if any(map(str.endswith, keys, repeat('.pdf'))):
+        summary.append(level_prefix + '.pdf')
+    marker_key = level_prefix + '.folder_marker'
+    if marker_key in keys:
+        summary.append(marker_key)
+    return summary
+
+
+def _collect_folders(prefixes):
+    """
+    指定プレフィックス配下のオブジェクトを列挙し、フォルダパスを抽出
+    
+    Delimiter='/' で階層ごとに列挙し、サブフォルダ（CommonPrefixes）を辿る。
+    job_id（14桁の数字）の階層はフォルダではないため辿らず、その配下はPDFが
+    見つかるまで一括列挙して各キーを同じ規則で判定する（親フォルダをファイル有りとする）。
+    各階層のLISTはスレッドプールで並列実行し、結果の集計はこのスレッドのみで行う。
+    
+    Args:
+        prefixes: S3プレフィックスのリスト（例: ["PDF/"], ["PDF/生技資料/"]）
+    
+    Returns:
+        (all_folders: set, folders_with_files: set)
+    """
+    all_folders = set()
+    folders_with_files = set()  # ファイルを含むフォルダを追跡
+    
+    with ThreadPoolExecutor(max_workers=LIST_MAX_WORKERS) as executor:
+        # future -> (prefix, delimiter)
+        in_flight = {executor.submit(_list_level, prefix, '/'): (prefix, '/') for prefix in prefixes}
+        
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            
+            for future in done:
+                level_prefix, delimiter = in_flight.pop(future)
+                keys, common_prefixes = future.result()
+                
+                if delimiter == '/':
+                    keys = _summarize_level_keys(level_prefix, keys)
+                _add_keys_folders(keys, all_folders, folders_with_files)
+                
+                for sub_prefix in common_prefixes:
+                    if _is_job_id(sub_prefix[:-1].rsplit('/', 1)[-1]):
+                        # job_id 配下: それ以上は辿らず、PDFが見つかるまで一括列挙（Delimiter なし）
+                        in_flight[executor.submit(_list_job_id_level, sub_prefix)] = (sub_prefix, '')
+                    else:
+                        in_flight[executor.submit(_list_level, sub_prefix, '/')] = (sub_prefix, '/')
+    
+    return all_folders, folders_with_files
+
+
+def _get_listing(use_cache=True):
+    """
+    フォルダ一覧（all_folders, folders_with_files）を取得
+    
+    ローカルキャッシュ → S3上のフォルダインデックス → S3列挙 の順に参照する。
+    
+    Args:
+        use_cache: False の場合は必ずS3を列挙し直す（インデックスは作り直す）
+    
+    Returns:
+        (all_folders, folders_with_files) のタプル
+    """
+    cached = _get_cached_listing() if use_cache else None
+    if cached:
+        return cached
+    
+    # S3上のフォルダインデックスがあれば GET 1回で済ませる
+    indexed = _load_index() if use_cache else None
+    if indexed:
+        all_folders, folders_with_files = indexed
+    else:
+        logger.info("Starting folder tree extraction from S3")
+        
+        # S3のPDF/配下のすべてのオブジェクトを取得
+        all_folders, folders_with_files = _collect_folders(['PDF/'])
+        _save_index(all_folders, folders_with_files)
+    
+    _listing_cache.update(
+        all_folders=all_folders,
+        folders_with_files=folders_with_files,
+        ts=time.monotonic()
+    )
+    
+    logger.info("Found %d unique folders, %d with files", len(all_folders), len(folders_with_files))
+    return all_folders, folders_with_files
+
+
+def get_folder_list(use_cache=True):
+    """
+    S3バケットのフォルダ一覧をフラットな形式（パス順）で取得
+    
+    ツリーの組み立ては行わないため、フロントエンド側でツリーを構築する場合はこちらを使う
+    （親フォルダは path の最後の '/' より前の部分）。
+    
+    Args:
+        use_cache: False の場合は必ずS3を列挙し直す（インデックスは作り直す）
+    
+    Returns:
+        [
+            {"path": "生技資料", "is_leaf": False, "can_delete": False},
+            {"path": "生技資料/生技25", "is_leaf": True, "can_delete": False}
+        ]
+    """
+    try:
+        all_folders, folders_with_files = _get_listing(use_cache)
+        
+        # 子フォルダを持つフォルダ（= 親パスの集合、親フォルダは必ず all_folders に含まれる）
+        # 子孫があれば直下の子もあるため、子孫フォルダの有無もこれで判定できる
+        parents = {fp.rsplit('/', 1)[0] for fp in all_folders if '/' in fp}
+        
+        folder_list = []
+        for folder_path in sorted(all_folders):
+            has_children = folder_path in parents
+            has_files = folder_path in folders_with_files
+            folder_list.append({
+                'path': folder_path,
+                'is_leaf': has_files and not has_children,  # ファイルあり・子フォルダなし
+                'can_delete': not has_files and not has_children  # 削除可能 = ファイルなし AND 子孫フォルダなし
+            })
+        
+        return folder_list
+        
+    except Exception as e:
+        logger.error("Error listing folders: %s", e, exc_info=True)
+        raise
+
 
-def get_folder_tree():
+def get_folder_tree(use_cache=True):
     """
     S3バケットのフォルダ構造を階層的に取得
     
@@ -21,6 +373,14 @@ def get_folder_tree():
     1. PDFファイルから検出されるフォルダ
     2. .folder_marker から検出されるフォルダ（新規作成時、ファイルがまだない場合）
     
+    S3の列挙結果は FOLDER_TREE_CACHE_TTL 秒間キャッシュする（ツリーは毎回新しく構築するため、
+    呼び出し側で変更しても問題ない）。キャッシュがない場合は S3 上のフォルダインデックス
+    （FOLDER_INDEX_KEY）を読み、なければ列挙してインデックスを作成する。
+    ツリーは get_folder_list() のパス順の一覧を1回走査して組み立てる。
+    
+    Args:
+        use_cache: False の場合は必ずS3を列挙し直す（インデックスは作り直す）
+    
     Returns:
         [
             {
@@ -32,145 +392,122 @@ def get_folder_tree():
                         "name": "生技25",
                         "path": "生技資料/生技25",
                         "is_leaf": False,
-                        "children": [...]
+                        "children": [...],
+                        "can_delete": False
                     }
-                ]
+                ],
+                "can_delete": False
             }
         ]
+        
+        全ノードが同じキー順・同じ型（str, str, bool, list, bool）のため、呼び出し側は
+        そのままコンパクトなJSON（separators=(',', ':'), ensure_ascii=False）に変換できる。
     """
     try:
-        logger.info("Starting folder tree extraction from S3")
-        all_folders = set()
-        folders_with_files = set()  # ファイルを含むフォルダを追跡
-        continuation_token = None
-        
-        # S3のPDF/配下のすべてのオブジェクトを取得
-        while True:
-            list_params = {
-                'Bucket': S3_BUCKET,
-                'Prefix': 'PDF/',
-                'Delimiter': ''
+        # 階層構造を構築（再帰なし・一覧はパス順のため親は必ず子より先に現れ、
+        # 親の children にもルートにも名前順で並ぶ）
+        folder_dict = {}
+        tree = []
+        for record in get_folder_list(use_cache):
+            folder_path = record['path']
+            parent_path, _, name = folder_path.rpartition('/')
+            folder_info = {
+                'name': name,
+                'path': folder_path,
+                'is_leaf': record['is_leaf'],
+                'children': [],
+                'can_delete': record['can_delete']
             }
-            
-            if continuation_token:
-                list_params['ContinuationToken'] = continuation_token
-            
-            response = s3_client.list_objects_v2(**list_params)
-            
-            if 'Contents' in response:
-                for obj in response['Contents']:
-                    key = obj['Key']
-                    
-                    # 方法1: PDFファイルから検出
-                    if key.startswith('PDF/') and key.endswith('.pdf'):
-                        parts = key[4:].split('/')  # PDF/ を除去
-                        
-                        # job_id を識別（14桁の数字）してフォルダパスを抽出
-                        folder_parts = []
-                        for part in parts[:-1]:  # 最後はファイル名
-                            if len(part) == 14 and part.isdigit():
-                                break
-                            folder_parts.append(part)
-                        
-                        if folder_parts:
-                            folder_path = '/'.join(folder_parts)
-                            all_folders.add(folder_path)
-                            folders_with_files.add(folder_path)  # ファイル有りとマーク
-                            
-                            # 中間フォルダも追加
-                            for i in range(1, len(folder_parts)):
-                                parent_path = '/'.join(folder_parts[:i])
-                                all_folders.add(parent_path)
-                    
-                    # 方法2: .folder_marker から検出（新規作成時、ファイルがまだない場合）
-                    elif key.startswith('PDF/') and key.endswith('/.folder_marker'):
-                        # PDF/folder_path/.folder_marker の形式
-                        folder_path = key[4:-len('/.folder_marker')]  # PDF/ と /.folder_marker を除去
-                        
-                        if folder_path:  # 空ではないことを確認
-                            all_folders.add(folder_path)
-                            
-                            # 親フォルダも追加
-                            parts = folder_path.split('/')
-                            for i in range(1, len(parts)):
-                                parent_path = '/'.join(parts[:i])
-                                all_folders.add(parent_path)
-            
-            if not response.get('IsTruncated'):
-                break
-            
-            continuation_token = response.get('NextContinuationToken')
+            folder_dict[folder_path] = folder_info
+            if parent_path:
+                folder_dict[parent_path]['children'].append(folder_info)
+            else:
+                tree.append(folder_info)
+        
+        logger.info("Built folder tree with %d root folders", len(tree))
+        return tree
+        
+    except Exception as e:
+        logger.error("Error building folder tree: %s", e, exc_info=True)
+        raise
+
+
+def get_folder_tree_for_prefixes(folder_paths):
+    """
+    指定フォルダ（登録済みフォルダ等）とその祖先フォルダのみからなるツリーを取得
+    
+    S3の列挙は指定フォルダ配下のみ（入れ子の指定は最上位のみ列挙、並列実行）。
+    各ノードの内容は get_folder_tree() の該当ノードと同じで、
+    指定フォルダの子孫のうち指定されていないものは含まない。
+    S3上に存在しない指定フォルダは無視する。
+    
+    Args:
+        folder_paths: フォルダパスのイテラブル（PDF/ プレフィックスなし）
+    
+    Returns:
+        get_folder_tree() と同じ形式のリスト
+    """
+    try:
+        requested = sorted({fp for fp in folder_paths if fp})
         
-        logger.info(f"Found {len(all_folders)} unique folders, {len(folders_with_files)} with files")
+        # 入れ子になっている指定フォルダは最上位の列挙に含まれる
+        list_roots = []
+        for folder_path in requested:
+            if not list_roots or not folder_path.startswith(list_roots[-1] + '/'):
+                list_roots.append(folder_path)
         
-        # フォルダ情報を構築
+        # PDF/ 全体の列挙キャッシュが有効ならそれを使う
+        cached = _get_cached_listing()
+        if cached:
+            all_folders, folders_with_files = cached
+        else:
+            logger.info("Starting folder tree extraction from S3 for %d prefixes", len(list_roots))
+            all_folders, folders_with_files = _collect_folders([f"PDF/{fp}/" for fp in list_roots])
+        
+        # 子フォルダを持つフォルダ（= 親パスの集合）
+        parents = {fp.rsplit('/', 1)[0] for fp in all_folders if '/' in fp}
+        
+        # 残すフォルダ: S3上に存在する指定フォルダとその祖先
         folder_dict = {}
-        for folder_path in sorted(all_folders):
-            parts = folder_path.split('/')
+        for folder_path in requested:
+            if folder_path not in all_folders:
+                continue
+            
+            has_files = folder_path in folders_with_files
+            has_descendants = folder_path in parents
             folder_dict[folder_path] = {
-                'name': parts[-1],
+                'name': folder_path.rsplit('/', 1)[-1],
                 'path': folder_path,
-                'is_leaf': folder_path in folders_with_files,  # ファイルがあれば is_leaf=True
-                'children': []
+                'is_leaf': has_files and not has_descendants,
+                'children': [],
+                'can_delete': not has_files and not has_descendants
             }
-        
-        # 親子関係を判定してis_leafを更新
-        # is_leaf=false にする条件: 子フォルダがある場合
-        for folder_path in all_folders:
-            prefix = folder_path + '/'
-            for other_path in all_folders:
-                if other_path.startswith(prefix) and other_path != folder_path:
-                    remaining = other_path[len(prefix):]
-                    if '/' not in remaining:
-                        # 直下に子フォルダがある → is_leaf=False
-                        folder_dict[folder_path]['is_leaf'] = False
-                        break
-        
-        # can_delete フラグを判定
-        # 削除可能条件: ファイルなし AND 子孫フォルダなし
-        for folder_path in all_folders:
-            prefix = folder_path + '/'
-            has_descendants = False
-            has_files = folder_path in folders_with_files
-            
-            # 子孫フォルダの有無をチェック
-            for other_path in all_folders:
-                if other_path.startswith(prefix) and other_path != folder_path:
-                    has_descendants = True
-                    break
-            
-            # 削除可能 = ファイルなし AND 子孫フォルダなし
-            folder_dict[folder_path]['can_delete'] = not has_files and not has_descendants
-        
-        # 階層構造を構築
-        def build_tree(parent_path):
-            children = []
-            prefix = parent_path + '/' if parent_path else ''
-            
-            for folder_path in sorted(all_folders):
-                if folder_path == parent_path:
-                    continue
-                
-                if folder_path.startswith(prefix):
-                    remaining = folder_path[len(prefix):]
-                    if '/' not in remaining:
-                        folder_info = folder_dict[folder_path].copy()
-                        folder_info['children'] = build_tree(folder_path)
-                        children.append(folder_info)
             
-            return children
+            # 祖先は子フォルダを持つため is_leaf=False, can_delete=False
+            parts = folder_path.split('/')
+            for i in range(1, len(parts)):
+                parent_path = '/'.join(parts[:i])
+                if parent_path not in folder_dict:
+                    folder_dict[parent_path] = {
+                        'name': parts[i - 1],
+                        'path': parent_path,
+                        'is_leaf': False,
+                        'children': [],
+                        'can_delete': False
+                    }
         
-        # ルートフォルダから構築
-        root_folders = [fp for fp in sorted(all_folders) if '/' not in fp]
+        # 階層構造を構築（パス順に処理すると兄弟は名前順になる）
         tree = []
-        for root_path in root_folders:
-            folder_info = folder_dict[root_path].copy()
-            folder_info['children'] = build_tree(root_path)
-            tree.append(folder_info)
+        for folder_path in sorted(folder_dict):
+            folder_info = folder_dict[folder_path]
+            if '/' in folder_path:
+                folder_dict[folder_path.rsplit('/', 1)[0]]['children'].append(folder_info)
+            else:
+                tree.append(folder_info)
         
-        logger.info(f"Built folder tree with {len(tree)} root folders")
+        logger.info("Built folder tree with %d root folders (%d folders)", len(tree), len(folder_dict))
         return tree
         
     except Exception as e:
-        logger.error(f"Error building folder tree: {e}", exc_info=True)
+        logger.error("Error building folder tree: %s", e, exc_info=True)
         raise
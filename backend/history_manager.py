@@ -9,10 +9,14 @@ import json
 import boto3
 import os
 import logging
+import time
+import traceback
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
 from botocore.exceptions import ClientError
 from botocore.config import Config
-from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.conditions import Key, Attr, ConditionExpressionBuilder
 from decimal import Decimal
 from urllib.parse import quote
 
@@ -25,7 +29,9 @@ DATA_S3_BUCKET = os.environ.get("DATA_S3_BUCKET")
 config = Config(
     connect_timeout=int(os.environ.get("HTTP_CONNECT_TIMEOUT", "10")),
     read_timeout=int(os.environ.get("HTTP_READ_TIMEOUT", "60")),
-    retries={'max_attempts': int(os.environ.get("HTTP_RETRIES", "3"))}
+    retries={'max_attempts': int(os.environ.get("HTTP_RETRIES", "3"))},
+    max_pool_connections=int(os.environ.get("HTTP_POOL_CONNECTIONS", "50")),
+    tcp_keepalive=True
 )
 
 # JST timezone (UTC+9)
@@ -34,23 +40,90 @@ JST = timezone(timedelta(hours=9))
 # ===== Environment Variables =====
 DYNAMODB_CHAT_HISTORY_TABLE = os.environ.get("DYNAMODB_CHAT_HISTORY_TABLE")
 
-# Lazy-create AWS resources
-_dynamodb = None
-_chat_history_table = None
-_s3_client = None
+# GSI on the chat history table (partition: chat_session_id, sort: message_id).
+# message_id starts with the ISO timestamp, so the index returns a session in time order.
+CHAT_SESSION_INDEX = 'chat_session_id-index'
+
+# Presigned URLs are reused within this window (seconds), so a warm container
+# signs each key at most once per window and browsers see a stable URL
+PRESIGNED_URL_CACHE_WINDOW = int(os.environ.get("PRESIGNED_URL_CACHE_WINDOW", "3600"))
+PRESIGNED_URL_CACHE_SIZE = 2048
+PRESIGN_MAX_WORKERS = int(os.environ.get("PRESIGN_MAX_WORKERS", "8"))
+
+# Lowercased copy of 'content' written by knowledge_querier, so search can use a
+# server-side contains() filter (DynamoDB contains is case-sensitive)
+SEARCH_CONTENT_ATTR = 'content_lc'
+SESSION_QUERY_MAX_WORKERS = int(os.environ.get("SESSION_QUERY_MAX_WORKERS", "8"))
+
+# Attributes read per use case (everything else, e.g. content_lc and ttl, stays in DynamoDB)
+SUMMARY_ATTRIBUTES = ('chat_session_id', 'timestamp', 'role', 'content', 'message_id')
+DETAIL_ATTRIBUTES = SUMMARY_ATTRIBUTES + (
+    'job_id', 'sources', 'selected_folder_paths', 'selected_job_id', 'rating', 'comment'
+)
+
+# Summaries (one full Scan each) are reused for this many seconds in a warm container,
+# keyed by mode: {mode: {'summaries': [...], 'ts': monotonic time}}
+SUMMARY_CACHE_TTL = int(os.environ.get("SUMMARY_CACHE_TTL", "30"))
+_summaries_cache = {}
+
+# Compact JSON for response bodies
+JSON_SEPARATORS = (',', ':')
+
+# Response headers (shared by all responses, built once per container)
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Content-Type': 'application/json'
+}
+
+# Items per Scan page request (DynamoDB still caps each page at 1MB)
+SCAN_PAGE_SIZE = int(os.environ.get("HISTORY_SCAN_PAGE_SIZE", "500"))
+
+# Full-table Scans are split into this many segments and scanned concurrently
+SCAN_TOTAL_SEGMENTS = int(os.environ.get("SCAN_TOTAL_SEGMENTS", str(min(8, (os.cpu_count() or 1) * 2))))
+
+# chat_session_id prefixes of the non-default modes
+MODE_SESSION_PREFIXES = {
+    'verification': 'verification_',
+    'specification': 'specification_'
+}
+
+# AWS resources are created once at import (INIT phase) and reused by warm invocations
+_session = boto3.session.Session()
+_dynamodb = _session.resource('dynamodb', region_name=DYNAMODB_REGION, config=config)
+_chat_history_table = _dynamodb.Table(DYNAMODB_CHAT_HISTORY_TABLE) if DYNAMODB_CHAT_HISTORY_TABLE else None
+_s3_client = _session.client('s3', region_name=DYNAMODB_REGION, config=config)
+
+# Decided once per container: an unconfigured table short-circuits every request
+_TABLE_CONFIGURED = _chat_history_table is not None
+if not _TABLE_CONFIGURED:
+    logger.warning('DYNAMODB_CHAT_HISTORY_TABLE not configured')
 
 
 def get_s3_client():
-    """Get or create S3 client"""
-    global _s3_client
-    if _s3_client is None:
-        _s3_client = boto3.client('s3', region_name=DYNAMODB_REGION, config=config)
+    """Get S3 client"""
     return _s3_client
 
 
+@lru_cache(maxsize=PRESIGNED_URL_CACHE_SIZE)
+def _presign_get_object(s3_key, expiration, window):
+    """
+    Sign a GET URL for an S3 object (cached per cache window; errors are raised, not cached).
+    Not logged per key: get_chat_history_by_id logs one summary line per request.
+    The window argument is only part of the cache key.
+    """
+    url = get_s3_client().generate_presigned_url(
+        'get_object',
+        Params={'Bucket': DATA_S3_BUCKET, 'Key': s3_key},
+        ExpiresIn=expiration
+    )
+    return url
+
+
 def generate_presigned_url(s3_key, expiration=604800):
     """
-    Generate a new presigned URL for an S3 object.
+    Generate a presigned URL for an S3 object.
+    The same URL is returned for a key within PRESIGNED_URL_CACHE_WINDOW seconds,
+    so it stays valid for at least expiration - PRESIGNED_URL_CACHE_WINDOW seconds.
     
     Args:
         s3_key: S3 object key (e.g., 'PDF/filename.pdf')
@@ -64,16 +137,9 @@ def generate_presigned_url(s3_key, expiration=604800):
         return None
     
     try:
-        s3_client = get_s3_client()
-        url = s3_client.generate_presigned_url(
-            'get_object',
-            Params={'Bucket': DATA_S3_BUCKET, 'Key': s3_key},
-            ExpiresIn=expiration
-        )
-        logger.info(f"Generated presigned URL for bucket={DATA_S3_BUCKET}, key={s3_key}")
-        return url
+        return _presign_get_object(s3_key, expiration, int(time.time() // PRESIGNED_URL_CACHE_WINDOW))
     except Exception as e:
-        logger.error(f"Error generating presigned URL for bucket={DATA_S3_BUCKET}, key={s3_key}: {e}")
+        logger.error("Error generating presigned URL for bucket=%s, key=%s: %s", DATA_S3_BUCKET, s3_key, e)
         return None
 
 
@@ -81,88 +147,201 @@ def decimal_to_native(obj):
     """
     Convert DynamoDB Decimal types to native Python types for JSON serialization.
     """
-    if isinstance(obj, list):
+    # Exact-type checks first: DynamoDB items only contain plain dict/list/Decimal
+    obj_type = type(obj)
+    if obj_type is dict:
+        return {k: decimal_to_native(v) for k, v in obj.items()}
+    elif obj_type is list:
+        return list(map(decimal_to_native, obj))
+    elif obj_type is Decimal:
+        # Convert to int if it's a whole number, otherwise float
+        int_value = int(obj)
+        return int_value if int_value == obj else float(obj)
+    elif obj_type is str:
+        return obj
+    # Subclasses (not produced by boto3, kept for safety)
+    elif isinstance(obj, list):
         return [decimal_to_native(i) for i in obj]
     elif isinstance(obj, dict):
         return {k: decimal_to_native(v) for k, v in obj.items()}
     elif isinstance(obj, Decimal):
-        # Convert to int if it's a whole number, otherwise float
-        if obj % 1 == 0:
-            return int(obj)
-        else:
-            return float(obj)
+        return decimal_to_native(Decimal(obj))
     else:
         return obj
 
 
-def get_chat_history_table():
-    """Lazy-initialize DynamoDB table"""
-    global _dynamodb, _chat_history_table
-    if _dynamodb is None:
-        _dynamodb = boto3.resource('dynamodb', region_name=DYNAMODB_REGION)
-    if _chat_history_table is None:
-        if not DYNAMODB_CHAT_HISTORY_TABLE:
-            logger.warning('DYNAMODB_CHAT_HISTORY_TABLE not configured')
-            return None
-        _chat_history_table = _dynamodb.Table(DYNAMODB_CHAT_HISTORY_TABLE)
-    return _chat_history_table
+def _json_default(obj):
+    """json.dumps hook: convert DynamoDB Decimal to int (whole number) or float."""
+    if isinstance(obj, Decimal):
+        int_value = int(obj)
+        return int_value if int_value == obj else float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _dumps(obj):
+    """Serialize a response body: compact, UTF-8 (no \\u escapes), Decimal converted while encoding."""
+    return json.dumps(obj, ensure_ascii=False, separators=JSON_SEPARATORS, default=_json_default)
+
+
+def json_response(status_code, body):
+    """Create a standardized API response"""
+    return {
+        'statusCode': status_code,
+        'headers': CORS_HEADERS,
+        'body': _dumps(body)
+    }
+
+
+def projection(attributes):
+    """
+    Build ProjectionExpression parameters for Scan/Query.
+    All names use placeholders (timestamp, role and comment are DynamoDB reserved words).
+    """
+    names = {f'#p{i}': attribute for i, attribute in enumerate(attributes)}
+    return {
+        'ProjectionExpression': ', '.join(names),
+        'ExpressionAttributeNames': names
+    }
+
+
+def _build_mode_filters():
+    """
+    Build the Scan FilterExpression of each mode (once, at import).
+    'verification' / 'specification' sessions are identified by their chat_session_id prefix,
+    'default' is everything without one of those prefixes.
+    """
+    session_id = Attr('chat_session_id')
+    mode_filters = {mode: session_id.begins_with(prefix) for mode, prefix in MODE_SESSION_PREFIXES.items()}
+    
+    default_filter = None
+    for prefix in MODE_SESSION_PREFIXES.values():
+        condition = ~session_id.begins_with(prefix)
+        default_filter = condition if default_filter is None else default_filter & condition
+    mode_filters['default'] = default_filter
+    
+    return mode_filters
+
 
+_MODE_FILTERS = _build_mode_filters()
 
-def get_chat_history_summaries(chat_session_id=None, mode=None):
+
+def mode_filter_expression(mode):
+    """
+    Get the Scan FilterExpression selecting the sessions of a mode.
+    Returns None (no filtering) for no/unknown mode.
+    """
+    return _MODE_FILTERS.get(mode)
+
+
+def scan_pages(table, **kwargs):
+    """
+    Iterate over all Scan pages of the table (boto3 paginator, SCAN_PAGE_SIZE items per request).
+    Extra keyword arguments (FilterExpression etc.) are passed to Scan.
+    """
+    paginator = table.meta.client.get_paginator('scan')
+    return paginator.paginate(
+        TableName=table.name,
+        PaginationConfig={'PageSize': SCAN_PAGE_SIZE},
+        **kwargs
+    )
+
+
+def _scan_segment(table, segment, total_segments, scan_kwargs):
+    """Scan one segment of the table, following pagination"""
+    items = []
+    for page in scan_pages(table, Segment=segment, TotalSegments=total_segments, **scan_kwargs):
+        items.extend(page.get('Items', []))
+    return items
+
+
+def scan_messages(table, mode=None, filter_expression=None, **kwargs):
+    """
+    Scan all chat history messages, filtered server-side by mode.
+    Segments are scanned concurrently (SCAN_TOTAL_SEGMENTS threads).
+    Args:
+        mode: Optional mode filter ('default', 'verification', 'specification')
+        filter_expression: Optional additional condition (combined with the mode filter)
+        kwargs: Extra Scan parameters (ProjectionExpression etc.)
+    Returns: list of messages
+    """
+    mode_expression = mode_filter_expression(mode)
+    if mode_expression is not None:
+        filter_expression = mode_expression if filter_expression is None else mode_expression & filter_expression
+    if filter_expression is not None:
+        # Build the expression once here: the condition builder boto3 attaches to the
+        # client is shared state and the segments below run in parallel
+        expression = ConditionExpressionBuilder().build_expression(filter_expression)
+        kwargs['FilterExpression'] = expression.condition_expression
+        kwargs['ExpressionAttributeNames'] = {
+            **kwargs.get('ExpressionAttributeNames', {}),
+            **expression.attribute_name_placeholders
+        }
+        if expression.attribute_value_placeholders:
+            kwargs['ExpressionAttributeValues'] = expression.attribute_value_placeholders
+    
+    total_segments = SCAN_TOTAL_SEGMENTS
+    if total_segments <= 1:
+        return _scan_segment(table, 0, 1, kwargs)
+    
+    with ThreadPoolExecutor(max_workers=total_segments) as executor:
+        segment_items = list(executor.map(
+            lambda segment: _scan_segment(table, segment, total_segments, kwargs),
+            range(total_segments)
+        ))
+    
+    return [item for items in segment_items for item in items]
+
+
+def get_chat_history_summaries(mode=None, refresh=False):
     """
     Retrieve all chat history summaries grouped by chat_session_id.
     Each chat_session_id represents one conversation session.
     Args:
-        chat_session_id: Optional specific session ID to filter
         mode: Optional mode filter ('default', 'verification', 'specification')
+        refresh: If True, skip the summaries cache (explicit refresh from the sidebar)
     Returns: list of conversation summaries sorted by timestamp (newest first)
+    
+    Summaries are reused for SUMMARY_CACHE_TTL seconds per mode in a warm container.
+    Messages are written by knowledge_querier (another Lambda), so the cache cannot be
+    invalidated on write; the sidebar's refresh button passes refresh=True instead.
     """
     try:
-        table = get_chat_history_table()
-        if not table:
+        if not _TABLE_CONFIGURED:
             return []
+        table = _chat_history_table
 
-        # Scan all messages without filtering (get all history)
-        response = table.scan()
+        cached = None if refresh else _summaries_cache.get(mode)
+        if cached and time.monotonic() - cached['ts'] < SUMMARY_CACHE_TTL:
+            logger.info("Using cached summaries (%d) for mode: %s", len(cached['summaries']), mode)
+            return list(cached['summaries'])
 
-        messages = response.get('Items', [])
-        logger.info(f"Retrieved {len(messages)} total messages from chat history")
+        # Scan all messages of this mode (mode filter is applied by DynamoDB)
+        messages = scan_messages(table, mode, **projection(SUMMARY_ATTRIBUTES))
+        logger.info("Retrieved %d total messages from chat history", len(messages))
         
-        # Group messages by chat_session_id with mode filtering
-        sessions = {}
+        # One pass over the messages: per session, count messages and keep the earliest
+        # user message as the conversation starter (no per-session sort; on equal
+        # timestamps the first scanned message wins, as with a stable sort)
+        sessions = {}  # session_id -> [message_count, first_user_message]
         for message in messages:
             session_id = message.get('chat_session_id', 'unknown')
             
-            # Filter by mode prefix
-            if mode:
-                if mode == 'verification' and not session_id.startswith('verification_'):
-                    continue
-                elif mode == 'specification' and not session_id.startswith('specification_'):
-                    continue
-                elif mode == 'default' and (session_id.startswith('verification_') or session_id.startswith('specification_')):
-                    continue
+            session = sessions.get(session_id)
+            if session is None:
+                session = sessions[session_id] = [0, None]
+            session[0] += 1
             
-            if session_id not in sessions:
-                sessions[session_id] = []
-            sessions[session_id].append(message)
+            if message.get('role') == 'user':
+                first_user_message = session[1]
+                if first_user_message is None or \
+                        message.get('timestamp', '') < first_user_message.get('timestamp', ''):
+                    session[1] = message
         
-        logger.info(f"Found {len(sessions)} unique chat sessions")
+        logger.info("Found %d unique chat sessions", len(sessions))
         
         # Create summaries for each session
         summaries = []
-        for session_id, session_messages in sessions.items():
-            # Sort messages by timestamp (oldest first for processing)
-            session_messages.sort(key=lambda x: x.get('timestamp', ''))
-            
-            # Find the first user message as the conversation starter
-            first_user_message = None
-            message_count = len(session_messages)
-            
-            for msg in session_messages:
-                if msg.get('role') == 'user':
-                    first_user_message = msg
-                    break
-            
+        for session_id, (message_count, first_user_message) in sessions.items():
             if first_user_message:
                 summaries.append({
                     'chat_session_id': session_id,
@@ -175,56 +354,91 @@ def get_chat_history_summaries(chat_session_id=None, mode=None):
         # Sort summaries by timestamp (newest first)
         summaries.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
         
-        logger.info(f"Created {len(summaries)} conversation summaries")
-        return summaries
+        logger.info("Created %d conversation summaries", len(summaries))
+        _summaries_cache[mode] = {'summaries': summaries, 'ts': time.monotonic()}
+        return list(summaries)
 
     except ClientError as e:
-        logger.error(f"Error retrieving chat history summaries: {e}")
+        logger.error("Error retrieving chat history summaries: %s", e)
         return []
     except Exception as e:
-        logger.error(f"Unexpected error retrieving chat history summaries: {e}")
+        logger.error("Unexpected error retrieving chat history summaries: %s", e)
         return []
 
 
-def get_chat_history_by_id(message_id):
+def query_session_messages(table, chat_session_id, attributes=DETAIL_ATTRIBUTES):
+    """
+    Retrieve all messages of one chat session via the chat_session_id GSI.
+    Args:
+        attributes: Attributes to return for each message
+    Returns: list of messages (message_id order, i.e. oldest first)
+    """
+    kwargs = {
+        'IndexName': CHAT_SESSION_INDEX,
+        'KeyConditionExpression': Key('chat_session_id').eq(chat_session_id),
+        'ScanIndexForward': True,
+        **projection(attributes)
+    }
+    response = table.query(**kwargs)
+    messages = response.get('Items', [])
+    
+    while 'LastEvaluatedKey' in response:
+        response = table.query(ExclusiveStartKey=response['LastEvaluatedKey'], **kwargs)
+        messages.extend(response.get('Items', []))
+    
+    return messages
+
+
+def find_message(table, message_id):
+    """
+    Locate a single message by message_id when its chat_session_id is unknown.
+    Scans with a server-side filter and stops at the first page containing the message.
+    Returns: message item or None
+    """
+    for page in scan_pages(table, FilterExpression=Attr('message_id').eq(message_id)):
+        items = page.get('Items', [])
+        if items:
+            return items[0]
+    return None
+
+
+def get_chat_history_by_id(message_id, chat_session_id=None):
     """
     Retrieve full conversation for a specific message_id's chat_session_id.
     Returns ALL messages in that chat session.
+    Args:
+        message_id: Message ID of any message in the conversation
+        chat_session_id: Session the message belongs to (queried directly via the GSI;
+                         falls back to a filtered scan if the message is not in it)
     Returns: dict with 'messages' (array of all messages), 'sources', 'chat_session_id', 'selected_folder_paths', 'selected_job_id'
     """
     try:
-        table = get_chat_history_table()
-        if not table:
+        if not _TABLE_CONFIGURED:
             return None
+        table = _chat_history_table
 
-        # Scan all messages to find the one with this message_id
-        response = table.scan()
-        all_messages = response.get('Items', [])
-        
-        # Find the message with the given message_id
-        target_message = None
-        for msg in all_messages:
-            if msg.get('message_id') == message_id:
-                target_message = msg
-                break
-        
-        if not target_message:
-            logger.warning(f"Message not found: {message_id}")
-            return None
+        session_messages = query_session_messages(table, chat_session_id) if chat_session_id else []
         
-        # Get chat_session_id from the message
-        chat_session_id = target_message.get('chat_session_id')
-        if not chat_session_id:
-            logger.warning(f"Message {message_id} has no chat_session_id")
-            return None
-        
-        # Filter messages by chat_session_id
-        session_messages = [msg for msg in all_messages if msg.get('chat_session_id') == chat_session_id]
+        if not any(msg.get('message_id') == message_id for msg in session_messages):
+            # The client did not send the message's own session: look the message up first
+            target_message = find_message(table, message_id)
+            
+            if not target_message:
+                logger.warning("Message not found: %s", message_id)
+                return None
+            
+            # Get chat_session_id from the message
+            chat_session_id = target_message.get('chat_session_id')
+            if not chat_session_id:
+                logger.warning("Message %s has no chat_session_id", message_id)
+                return None
+            
+            session_messages = query_session_messages(table, chat_session_id)
         
         # Sort by timestamp (oldest first for display)
         session_messages.sort(key=lambda x: x.get('timestamp', ''))
         
-        logger.info(f"Retrieved {len(session_messages)} messages for session {chat_session_id}")
+        logger.info("Retrieved %d messages for session %s", len(session_messages), chat_session_id)
         
         # Extract folder selection info from first user message
         selected_folder_paths = None
@@ -234,14 +448,12 @@ def get_chat_history_by_id(message_id):
             if msg.get('role') == 'user':
                 if 'selected_folder_paths' in msg:
                     selected_folder_paths = msg.get('selected_folder_paths')
-                    logger.info(f"Found selected_folder_paths in first user message: {selected_folder_paths}")
                 if 'selected_job_id' in msg:
                     selected_job_id = msg.get('selected_job_id')
-                    logger.info(f"Found selected_job_id in first user message: {selected_job_id}")
                 break  # Only check first user message
         
-        # Collect all sources from all assistant messages
-        sources_dict = {}
+        # Collect all unique sources (first occurrence per s3Key) from all assistant messages
+        unique_sources = {}
         for msg in session_messages:
             if msg.get('role') == 'assistant' and 'sources' in msg:
                 sources = msg.get('sources', [])
@@ -249,19 +461,29 @@ def get_chat_history_by_id(message_id):
                     for source in sources:
                         if isinstance(source, dict):
                             s3_key = source.get('s3Key')
-                            
-                            if s3_key and s3_key not in sources_dict:
-                                # Generate fresh presigned URL
-                                presigned_url = generate_presigned_url(s3_key)
-                                
-                                if presigned_url:
-                                    file_name = source.get('fileName') or source.get('pdfFileName') or s3_key.split('/')[-1]
-                                    source_copy = {
-                                        'fileName': file_name,
-                                        's3Key': s3_key,
-                                        'presignedUrl': presigned_url
-                                    }
-                                    sources_dict[s3_key] = source_copy
+                            if s3_key and s3_key not in unique_sources:
+                                unique_sources[s3_key] = source
+        
+        # Generate fresh presigned URLs in parallel
+        s3_keys = list(unique_sources)
+        sign_start = time.monotonic()
+        if len(s3_keys) > 1:
+            with ThreadPoolExecutor(max_workers=min(PRESIGN_MAX_WORKERS, len(s3_keys))) as executor:
+                presigned_urls = list(executor.map(generate_presigned_url, s3_keys))
+        else:
+            presigned_urls = [generate_presigned_url(s3_key) for s3_key in s3_keys]
+        
+        sources_dict = {}
+        for s3_key, presigned_url in zip(s3_keys, presigned_urls):
+            if presigned_url:
+                source = unique_sources[s3_key]
+                file_name = source.get('fileName') or source.get('pdfFileName') or s3_key.split('/')[-1]
+                sources_dict[s3_key] = {
+                    'fileName': file_name,
+                    's3Key': s3_key,
+                    'presignedUrl': presigned_url
+                }
+        logger.info("Signed %d URLs in %dms (bucket=%s)", len(sources_dict), (time.monotonic() - sign_start) * 1000, DATA_S3_BUCKET)
         
         # Build response with ALL messages in the session
         result = {
@@ -277,21 +499,21 @@ def get_chat_history_by_id(message_id):
         if selected_job_id:
             result['selected_job_id'] = selected_job_id
         
-        logger.info(f"Retrieved history with {len(session_messages)} messages and {len(result['sources'])} sources")
-        if selected_folder_paths:
-            logger.info(f"Session had selected_folder_paths: {selected_folder_paths}")
+        logger.info("Retrieved history with %d messages and %d sources", len(session_messages), len(result['sources']))
+        if selected_folder_paths or selected_job_id:
+            logger.info("Session had selected_folder_paths: %s, selected_job_id: %s", selected_folder_paths, selected_job_id)
         
         return result
 
     except ClientError as e:
-        logger.error(f"Error retrieving chat history detail: {e}")
+        logger.error("Error retrieving chat history detail: %s", e)
         return None
     except Exception as e:
-        logger.error(f"Unexpected error retrieving chat history detail: {e}")
+        logger.error("Unexpected error retrieving chat history detail: %s", e)
         return None
 
 
-def update_feedback(message_id, rating=None, comment=None):
+def update_feedback(message_id, rating=None, comment=None, job_id=None, chat_session_id=None):
     """
     Update rating and/or comment for a message in DynamoDB.
     
@@ -299,38 +521,44 @@ def update_feedback(message_id, rating=None, comment=None):
         message_id: The message ID to update
         rating: Integer 1-10 or None
         comment: Comment text or None
+        job_id: job_id of the message (partition key) if the client knows it;
+                the item is then updated directly without any lookup
+        chat_session_id: Session of the message, used to look up job_id via the GSI
+                         when job_id is not given
     
     Returns:
         dict with success status or error
     """
     try:
-        table = get_chat_history_table()
-        if not table:
+        if not _TABLE_CONFIGURED:
             logger.error("Chat history table not configured")
             return {'success': False, 'error': 'テーブルが設定されていません'}
-        
-        # Scan to find the message (since message_id is not the primary key)
-        response = table.scan()
-        all_messages = response.get('Items', [])
-        
-        # Find message with matching message_id
-        target_message = None
-        for msg in all_messages:
-            if msg.get('message_id') == message_id:
-                target_message = msg
-                break
-        
-        if not target_message:
-            logger.warning(f"Message not found: {message_id}")
-            return {'success': False, 'error': 'メッセージが見つかりません'}
-        
-        # DynamoDB requires primary key to update
-        # We need job_id and message_id as the key
-        job_id = target_message.get('job_id')
+        table = _chat_history_table
         
         if not job_id:
-            logger.error(f"Message {message_id} has no job_id")
-            return {'success': False, 'error': 'ジョブIDが見つかりません'}
+            # Find the message (message_id alone is not the primary key):
+            # its session via the GSI first, then a filtered scan
+            target_message = None
+            if chat_session_id:
+                target_message = next(
+                    (msg for msg in query_session_messages(table, chat_session_id, ('job_id', 'message_id'))
+                     if msg.get('message_id') == message_id),
+                    None
+                )
+            if not target_message:
+                target_message = find_message(table, message_id)
+            
+            if not target_message:
+                logger.warning("Message not found: %s", message_id)
+                return {'success': False, 'error': 'メッセージが見つかりません'}
+            
+            # DynamoDB requires primary key to update
+            # We need job_id and message_id as the key
+            job_id = target_message.get('job_id')
+            
+            if not job_id:
+                logger.error("Message %s has no job_id", message_id)
+                return {'success': False, 'error': 'ジョブIDが見つかりません'}
         
         # Build the update expression dynamically
         update_parts = []
@@ -348,7 +576,7 @@ def update_feedback(message_id, rating=None, comment=None):
             expression_attribute_names['#c'] = 'comment'
         
         if not update_parts:
-            logger.warning(f"No updates specified for message {message_id}")
+            logger.warning("No updates specified for message %s", message_id)
             return {'success': False, 'error': '更新内容が指定されていません'}
         
         # Add updated_at timestamp
@@ -363,15 +591,15 @@ def update_feedback(message_id, rating=None, comment=None):
         
         update_expression = 'SET ' + ', '.join(update_parts)
         
-        logger.info(f"Update expression: {update_expression}")
-        logger.info(f"Expression values: {expression_values}")
-        logger.info(f"Expression attribute names: {expression_attribute_names}")
-        logger.info(f"Update key: {key}")
+        logger.info("Update key: %s, expression: %s, values: %s, names: %s",
+                    key, update_expression, expression_values, expression_attribute_names)
         
         # Execute update
         kwargs = {
             'Key': key,
             'UpdateExpression': update_expression,
+            # Only update an existing message (never create a new item from a client-provided key)
+            'ConditionExpression': Attr('message_id').eq(message_id),
             'ExpressionAttributeValues': expression_values,
             'ReturnValues': 'ALL_NEW'
         }
@@ -380,10 +608,17 @@ def update_feedback(message_id, rating=None, comment=None):
         if expression_attribute_names:
             kwargs['ExpressionAttributeNames'] = expression_attribute_names
         
-        response = table.update_item(**kwargs)
+        try:
+            response = table.update_item(**kwargs)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                logger.warning("Message not found: job_id=%s, message_id=%s", job_id, message_id)
+                return {'success': False, 'error': 'メッセージが見つかりません'}
+            raise
         
-        logger.info(f"Update successful for message {message_id}")
+        logger.info("Update successful for message %s", message_id)
         updated_item = response.get('Attributes', {})
+        updated_item.pop(SEARCH_CONTENT_ATTR, None)
         updated_item = decimal_to_native(updated_item)
         
         return {
@@ -393,14 +628,56 @@ def update_feedback(message_id, rating=None, comment=None):
         }
         
     except ClientError as e:
-        logger.error(f"Error updating feedback: {e}")
+        logger.error("Error updating feedback: %s", e)
         return {'success': False, 'error': f'DynamoDBエラー: {str(e)[:100]}'}
     except Exception as e:
-        logger.error(f"Unexpected error updating feedback: {e}")
+        logger.error("Unexpected error updating feedback: %s", e)
         return {'success': False, 'error': f'エラーが発生しました: {str(e)[:100]}'}
 
 
 
+def search_filter_expression(search_query):
+    """
+    Build the Scan FilterExpression preselecting messages that may contain search_query
+    (case-insensitive). Messages saved before SEARCH_CONTENT_ATTR existed are always
+    returned for a query with cased characters and checked by the caller.
+    """
+    search_lower = search_query.lower()
+    if search_lower == search_query.upper():
+        # No cased characters (e.g. Japanese): case does not matter
+        return Attr('content').contains(search_query)
+    return Attr(SEARCH_CONTENT_ATTR).contains(search_lower) | Attr(SEARCH_CONTENT_ATTR).not_exists()
+
+
+def load_sessions(table, session_ids):
+    """
+    Retrieve all messages of the given sessions ('' = messages without chat_session_id).
+    Sessions are queried in parallel via the chat_session_id GSI.
+    Returns: list of messages
+    """
+    session_ids = list(session_ids)
+    messages = []
+    
+    if '' in session_ids:
+        session_ids.remove('')
+        messages.extend(scan_messages(
+            table,
+            filter_expression=Attr('chat_session_id').not_exists(),
+            **projection(SUMMARY_ATTRIBUTES)
+        ))
+    
+    if len(session_ids) > 1:
+        with ThreadPoolExecutor(max_workers=min(SESSION_QUERY_MAX_WORKERS, len(session_ids))) as executor:
+            for session_messages in executor.map(
+                lambda sid: query_session_messages(table, sid, SUMMARY_ATTRIBUTES), session_ids
+            ):
+                messages.extend(session_messages)
+    elif session_ids:
+        messages.extend(query_session_messages(table, session_ids[0], SUMMARY_ATTRIBUTES))
+    
+    return messages
+
+
 def search_chat_history(chat_session_id, search_query, mode=None):
     """
     Search chat history for messages containing search_query.
@@ -411,112 +688,97 @@ def search_chat_history(chat_session_id, search_query, mode=None):
     Returns: list of matching conversations with snippets
     
     Note: Searches across ALL sessions for the search query,
-    then groups results by session and conversation
+    then groups results by session and conversation.
+    DynamoDB returns only (possibly) matching messages; the sessions containing a match
+    are then loaded in full to rebuild their conversations.
     """
 
     try:
-        table = get_chat_history_table()
-        if not table:
+        if not _TABLE_CONFIGURED:
             return []
+        table = _chat_history_table
 
-        # Scan ALL messages in the table (not just this session)
-        # to find all conversations containing the search query
-        logger.info(f"[search_chat_history] Scanning table for query: {search_query}")
-        
-        # Use scan instead of query to search across all sessions
-        response = table.scan()
-        messages = response.get('Items', [])
-        
-        # Handle pagination if needed
-        while 'LastEvaluatedKey' in response:
-            response = table.scan(ExclusiveStartKey=response['LastEvaluatedKey'])
-            messages.extend(response.get('Items', []))
-        
-        logger.info(f"[search_chat_history] Scanned {len(messages)} total messages")
+        # Scan ALL sessions (not just this session) to find the sessions containing
+        # the search query (mode and content filters are applied by DynamoDB)
+        logger.info("[search_chat_history] Scanning table for query: %s", search_query)
         search_lower = search_query.lower()
         
-        # Group messages by session and timestamp (to reconstruct conversations)
-        # Dictionary: session_id -> timestamp -> list of messages
-        sessions_by_id = {}
+        candidates = scan_messages(
+            table, mode,
+            filter_expression=search_filter_expression(search_query),
+            **projection(('chat_session_id', 'content'))
+        )
+        matched_session_ids = {
+            msg.get('chat_session_id', '')
+            for msg in candidates
+            if search_lower in msg.get('content', '').lower()
+        }
+        logger.info("[search_chat_history] %d candidate messages in %d matching sessions", len(candidates), len(matched_session_ids))
+        
+        # Load the matching sessions in full (conversation boundaries and message counts)
+        messages = load_sessions(table, matched_session_ids)
+        logger.info("[search_chat_history] Loaded %d messages", len(messages))
         
+        # Group messages by session (to reconstruct conversations)
+        messages_by_session = {}
         for message in messages:
-            session_id = message.get('chat_session_id', '')
-            
-            # Filter by mode prefix
-            if mode:
-                if mode == 'verification' and not session_id.startswith('verification_'):
-                    continue
-                elif mode == 'specification' and not session_id.startswith('specification_'):
-                    continue
-                elif mode == 'default' and (session_id.startswith('verification_') or session_id.startswith('specification_')):
-                    continue
-            
-            timestamp = message.get('timestamp', '')
-            
-            if session_id not in sessions_by_id:
-                sessions_by_id[session_id] = {}
-            if timestamp not in sessions_by_id[session_id]:
-                sessions_by_id[session_id][timestamp] = []
-            
-            sessions_by_id[session_id][timestamp].append(message)
+            messages_by_session.setdefault(message.get('chat_session_id', ''), []).append(message)
         
-        logger.info(f"[search_chat_history] Grouped into {len(sessions_by_id)} sessions")
+        logger.info("[search_chat_history] Grouped into %d sessions", len(messages_by_session))
         
-        # Find matching conversations
-        matching_conversations = []
+        # Walk each session once in timestamp order, keeping only matching conversations
+        results = []
         
-        for session_id in sorted(sessions_by_id.keys()):
-            session_messages = sessions_by_id[session_id]
+        for session_id in sorted(messages_by_session):
+            session_messages = messages_by_session[session_id]
             
-            # Sort by timestamp to reconstruct conversation flow
-            sorted_times = sorted(session_messages.keys())
+            # Sort by timestamp to reconstruct conversation flow (stable: same-timestamp messages keep scan order)
+            session_messages.sort(key=lambda x: x.get('timestamp', ''))
             
             current_conversation = None
             
-            for timestamp in sorted_times:
-                for message in session_messages[timestamp]:
-                    role = message.get('role', '')
-                    content = message.get('content', '')
-                    message_id = message.get('message_id', '')
+            for message in session_messages:
+                role = message.get('role', '')
+                
+                if role == 'user':
+                    # Start new conversation
+                    if current_conversation and current_conversation['has_match']:
+                        results.append(current_conversation)
                     
-                    if role == 'user':
-                        # Start new conversation
-                        if current_conversation:
-                            matching_conversations.append(current_conversation)
-                        
-                        matches = search_lower in content.lower()
-                        current_conversation = {
-                            'first_question': content,
-                            'timestamp': timestamp,
-                            'message_id': message_id,
-                            'message_count': 1,
-                            'has_match': matches,
-                            'matched_content': content if matches else None
-                        }
-                    elif role == 'assistant' and current_conversation:
-                        matches = search_lower in content.lower()
-                        if matches:
+                    content = message.get('content', '')
+                    matches = search_lower in content.lower()
+                    current_conversation = {
+                        'chat_session_id': session_id,
+                        'first_question': content,
+                        'timestamp': message.get('timestamp', ''),
+                        'message_id': message.get('message_id', ''),
+                        'message_count': 1,
+                        'has_match': matches,
+                        'matched_content': content if matches else None
+                    }
+                elif role == 'assistant' and current_conversation:
+                    # Once a conversation matches, its remaining answers only need counting
+                    if not current_conversation['has_match']:
+                        content = message.get('content', '')
+                        if search_lower in content.lower():
                             current_conversation['has_match'] = True
-                            if not current_conversation['matched_content']:
-                                current_conversation['matched_content'] = content
-                        
-                        current_conversation['message_count'] += 1
+                            current_conversation['matched_content'] = content
+                    
+                    current_conversation['message_count'] += 1
             
             # Add last conversation in this session if it matches
-            if current_conversation:
-                matching_conversations.append(current_conversation)
+            if current_conversation and current_conversation['has_match']:
+                results.append(current_conversation)
         
-        # Filter to only those that match
-        results = [c for c in matching_conversations if c['has_match']]
-        logger.info(f"Found {len(results)} matching conversations for query: {search_query}")
+        logger.info("Found %d matching conversations for query: %s", len(results), search_query)
         
         return results
 
     except ClientError as e:
-        logger.error(f"Error searching chat history: {e}")
+        logger.error("Error searching chat history: %s", e)
         return []
     except Exception as e:
-        logger.error(f"Unexpected error searching chat history: {e}")
+        logger.error("Unexpected error searching chat history: %s", e)
         return []
 
 
@@ -528,7 +790,8 @@ def lambda_handler(event, context):
     {
         "chat_session_id": "xxxxxxxx-xxxx",  (required)
         "action": "get-history|get-history-detail|search",  (required)
-        "message_id": "...",                  (required if action=get-history-detail)
+        "message_id": "...",                  (required if action=get-history-detail|update-feedback)
+        "job_id": "...",                      (optional, action=update-feedback: updates the message directly)
         "search_query": "検索テキスト"         (required if action=search)
     }
     
@@ -543,150 +806,86 @@ def lambda_handler(event, context):
     }
     """
     
-    logger.info(f"Event received for action")
+    logger.info("Event received for action")
     
     try:
-        # Parse request body
-        if isinstance(event.get('body'), str):
-            body = json.loads(event['body'])
-        else:
-            body = event.get('body', {})
+        # Parse request body (API Gateway passes a JSON string, direct invocations a dict)
+        body = event.get('body') or {}
+        if type(body) is str:
+            body = json.loads(body)
 
-        logger.info(f"Parsed body: {json.dumps(body)}")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Parsed body: %s", json.dumps(body))
 
         chat_session_id = (body.get('chat_session_id', '') or '').strip()
         action = (body.get('action', 'get-history') or 'get-history').strip().lower()
         
-        logger.info(f"chat_session_id: {chat_session_id}, action: {action}")
+        logger.info("chat_session_id: %s, action: %s", chat_session_id, action)
         
         # Validate chat_session_id (required for most actions except update-feedback)
         if not chat_session_id and action != 'update-feedback':
-            logger.error(f"Missing chat_session_id for action: {action}")
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Access-Control-Allow-Origin': '*',
-                    'Content-Type': 'application/json'
-                },
-                'body': json.dumps({
-                    'error': 'チャットセッションIDが指定されていません'
-                })
-            }
+            logger.error("Missing chat_session_id for action: %s", action)
+            return json_response(400, {
+                'error': 'チャットセッションIDが指定されていません'
+            })
         
         # Handle different actions
         if action == 'get-history':
             mode = body.get('mode', 'default')
-            logger.info(f"Getting history summaries for chat_session_id: {chat_session_id}, mode: {mode}")
-            histories = get_chat_history_summaries(chat_session_id, mode=mode)
-            
-            logger.info(f"Returning {len(histories)} histories")
+            refresh = bool(body.get('refresh'))
+            logger.info("Getting history summaries for chat_session_id: %s, mode: %s, refresh: %s", chat_session_id, mode, refresh)
+            histories = get_chat_history_summaries(mode=mode, refresh=refresh)
             
-            # Convert Decimal to native types
-            histories = decimal_to_native(histories)
+            logger.info("Returning %d histories", len(histories))
             
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Access-Control-Allow-Origin': '*',
-                    'Content-Type': 'application/json'
-                },
-                'body': json.dumps({
-                    'histories': histories
-                }, ensure_ascii=False)
-            }
+            return json_response(200, {
+                'histories': histories
+            })
         
         elif action == 'get-history-detail':
             message_id = (body.get('message_id', '') or '').strip()
             if not message_id:
                 logger.error("Missing message_id for get-history-detail action")
-                return {
-                    'statusCode': 400,
-                    'headers': {
-                        'Access-Control-Allow-Origin': '*',
-                        'Content-Type': 'application/json'
-                    },
-                    'body': json.dumps({
-                        'error': 'メッセージIDが指定されていません'
-                    })
-                }
+                return json_response(400, {
+                    'error': 'メッセージIDが指定されていません'
+                })
             
-            logger.info(f"Getting history detail for message_id: {message_id}")
-            history_detail = get_chat_history_by_id(message_id)
+            logger.info("Getting history detail for message_id: %s", message_id)
+            history_detail = get_chat_history_by_id(message_id, chat_session_id)
             
             if not history_detail:
-                return {
-                    'statusCode': 404,
-                    'headers': {
-                        'Access-Control-Allow-Origin': '*',
-                        'Content-Type': 'application/json'
-                    },
-                    'body': json.dumps({
-                        'error': '履歴が見つかりません'
-                    })
-                }
-            
-            # Convert Decimal to native types
-            history_detail = decimal_to_native(history_detail)
+                return json_response(404, {
+                    'error': '履歴が見つかりません'
+                })
             
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Access-Control-Allow-Origin': '*',
-                    'Content-Type': 'application/json'
-                },
-                'body': json.dumps({
-                    'history': history_detail
-                }, ensure_ascii=False)
-            }
+            return json_response(200, {
+                'history': history_detail
+            })
         
         elif action == 'search':
             search_query = (body.get('search_query', '') or '').strip()
             mode = body.get('mode', 'default')
             if not search_query:
                 logger.error("Missing search_query for search action")
-                return {
-                    'statusCode': 400,
-                    'headers': {
-                        'Access-Control-Allow-Origin': '*',
-                        'Content-Type': 'application/json'
-                    },
-                    'body': json.dumps({
-                        'error': '検索キーワードが指定されていません'
-                    })
-                }
+                return json_response(400, {
+                    'error': '検索キーワードが指定されていません'
+                })
             
-            logger.info(f"Searching history for: {search_query}, mode: {mode}")
+            logger.info("Searching history for: %s, mode: %s", search_query, mode)
             results = search_chat_history(chat_session_id, search_query, mode=mode)
             
-            # Convert Decimal to native types
-            results = decimal_to_native(results)
-            
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Access-Control-Allow-Origin': '*',
-                    'Content-Type': 'application/json'
-                },
-                'body': json.dumps({
-                    'results': results
-                }, ensure_ascii=False)
-            }
+            return json_response(200, {
+                'results': results
+            })
         
         elif action == 'update-feedback':
             # Handle rating and comment updates
             message_id = (body.get('message_id', '') or '').strip()
             if not message_id:
                 logger.error("Missing message_id for update-feedback action")
-                return {
-                    'statusCode': 400,
-                    'headers': {
-                        'Access-Control-Allow-Origin': '*',
-                        'Content-Type': 'application/json'
-                    },
-                    'body': json.dumps({
-                        'error': 'メッセージIDが指定されていません'
-                    })
-                }
+                return json_response(400, {
+                    'error': 'メッセージIDが指定されていません'
+                })
             
             rating = body.get('rating')
             comment = body.get('comment')
@@ -698,74 +897,42 @@ def lambda_handler(event, context):
                     if rating < 1 or rating > 10:
                         raise ValueError("Rating must be between 1 and 10")
                 except (ValueError, TypeError):
-                    return {
-                        'statusCode': 400,
-                        'headers': {
-                            'Access-Control-Allow-Origin': '*',
-                            'Content-Type': 'application/json'
-                        },
-                        'body': json.dumps({
-                            'error': '評価は1～10の数値である必要があります'
-                        })
-                    }
+                    return json_response(400, {
+                        'error': '評価は1～10の数値である必要があります'
+                    })
             
-            logger.info(f"Updating feedback for message_id: {message_id}, rating: {rating}, comment: {comment}")
-            result = update_feedback(message_id, rating=rating, comment=comment)
+            logger.info("Updating feedback for message_id: %s, rating: %s, comment: %s", message_id, rating, comment)
+            job_id = (body.get('job_id', '') or '').strip() or None
+            result = update_feedback(
+                message_id, rating=rating, comment=comment,
+                job_id=job_id, chat_session_id=chat_session_id or None
+            )
             
             if not result.get('success'):
-                return {
-                    'statusCode': 400,
-                    'headers': {
-                        'Access-Control-Allow-Origin': '*',
-                        'Content-Type': 'application/json'
-                    },
-                    'body': json.dumps({
-                        'error': result.get('error', 'フィードバック更新に失敗しました')
-                    })
-                }
+                return json_response(400, {
+                    'error': result.get('error', 'フィードバック更新に失敗しました')
+                })
             
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Access-Control-Allow-Origin': '*',
-                    'Content-Type': 'application/json'
-                },
-                'body': json.dumps({
-                    'message': result.get('message', 'フィードバックが保存されました'),
-                    'updated_item': result.get('updated_item', {})
-                }, ensure_ascii=False)
-            }
+            return json_response(200, {
+                'message': result.get('message', 'フィードバックが保存されました'),
+                'updated_item': result.get('updated_item', {})
+            })
         
         else:
-            logger.error(f"Unknown action: {action}")
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Access-Control-Allow-Origin': '*',
-                    'Content-Type': 'application/json'
-                },
-                'body': json.dumps({
-                    'error': '不正なアクションです'
-                })
-            }
+            logger.error("Unknown action: %s", action)
+            return json_response(400, {
+                'error': '不正なアクションです'
+            })
 
         
     except Exception as e:
-        logger.error(f"Error processing request: {e}", exc_info=True)
+        logger.error("Error processing request: %s", e, exc_info=True)
         
-        import traceback
         error_details = traceback.format_exc()
-        logger.error(f"Full traceback: {error_details}")
+        logger.error("Full traceback: %s", error_details)
         
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Content-Type': 'application/json'
-            },
-            'body': json.dumps({
-                'error': 'エラーが発生しました',
-                'details': str(e)[:200],
-                'traceback': error_details[:500]
-            }, ensure_ascii=False)
-        }
+        return json_response(500, {
+            'error': 'エラーが発生しました',
+            'details': str(e)[:200],
+            'traceback': error_details[:500]
+        })
@@ -11,18 +11,33 @@ Receives processing requests from API Gateway and:
 import json
 import boto3
 import os
+import time
 from datetime import datetime, timezone, timedelta
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from botocore.config import Config
 from botocore.exceptions import ClientError
-from folder_tree_helper import get_folder_tree
+from boto3.dynamodb.types import TypeSerializer
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-# AWS Clients
-s3_client = boto3.client('s3')
-dynamodb = boto3.resource('dynamodb')
-stepfunctions_client = boto3.client('stepfunctions')
+# Shared client config: pool sized for the parallel S3/DynamoDB calls, keep-alive for warm containers
+config = Config(
+    connect_timeout=int(os.environ.get('HTTP_CONNECT_TIMEOUT', '10')),
+    read_timeout=int(os.environ.get('HTTP_READ_TIMEOUT', '60')),
+    retries={'max_attempts': int(os.environ.get('HTTP_RETRIES', '3')), 'mode': 'adaptive'},
+    max_pool_connections=int(os.environ.get('HTTP_POOL_CONNECTIONS', '50')),
+    tcp_keepalive=True
+)
+
+# AWS Clients (one session: credentials are resolved once for all clients)
+session = boto3.session.Session()
+s3_client = session.client('s3', config=config)
+dynamodb = session.resource('dynamodb', config=config)
+stepfunctions_client = session.client('stepfunctions', config=config)
+# ジョブ項目の一括登録用low-levelクライアント（Table resourceの項目ごとのマーシャリングを回避）
+dynamodb_client = session.client('dynamodb', config=config)
 
 # Environment variables
 DYNAMODB_TABLE = os.environ['DYNAMODB_TABLE']
@@ -37,16 +52,212 @@ folder_config_table = dynamodb.Table(DYNAMODB_FOLDER_CONFIG_TABLE) if DYNAMODB_F
 # JST timezone (UTC+9)
 JST = timezone(timedelta(hours=9))
 
+# 独立したS3/DynamoDB呼び出しを並列化する共有エグゼキュータ（ウォーム起動間で再利用）
+IO_MAX_WORKERS = int(os.environ.get('JOB_IO_MAX_WORKERS', '16'))
+_EXECUTOR = ThreadPoolExecutor(max_workers=IO_MAX_WORKERS)
+
+# BatchWriteItem の1リクエストあたり上限件数と UnprocessedItems の再試行回数
+BATCH_WRITE_SIZE = 25
+BATCH_WRITE_MAX_RETRIES = 5
+# BatchGetItem の1リクエストあたり上限キー数と UnprocessedKeys の再試行回数
+BATCH_GET_SIZE = 100
+BATCH_GET_MAX_RETRIES = 5
+# Step Functions の実行入力サイズ上限（UTF-8バイト）
+SFN_MAX_INPUT_BYTES = 262144
+
+_serializer = TypeSerializer()
+
+# Compact JSON for response bodies and Step Functions input (no whitespace between tokens)
+JSON_SEPARATORS = (',', ':')
+
+CORS_HEADERS = {
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*'
+}
+
+
+def _dumps(obj):
+    """Serialize to compact UTF-8 JSON (Japanese text is kept as-is, not \\u-escaped)"""
+    return json.dumps(obj, ensure_ascii=False, separators=JSON_SEPARATORS)
+
+
+def json_response(status_code, body):
+    """Create a standardized API response"""
+    return {
+        'statusCode': status_code,
+        'headers': CORS_HEADERS,
+        'body': _dumps(body)
+    }
+
+
+def check_execution_input_size(execution_input_str):
+    """
+    Step Functions入力が256KB上限以内かチェック（超過時は ValueError）
+    
+    UTF-8は1文字最大4バイトのため、文字数だけで判定できる場合はエンコードしない
+    """
+    input_length = len(execution_input_str)
+    if input_length * 4 <= SFN_MAX_INPUT_BYTES:
+        logger.info(f"Step Functions input size: {input_length} chars (max: {SFN_MAX_INPUT_BYTES} bytes)")
+        return
+    
+    input_size = input_length if execution_input_str.isascii() else len(execution_input_str.encode('utf-8'))
+    logger.info(f"Step Functions input size: {input_size} bytes (max: {SFN_MAX_INPUT_BYTES})")
+    
+    if input_size > SFN_MAX_INPUT_BYTES:
+        error_msg = f"Execution input too large: {input_size} bytes (max: {SFN_MAX_INPUT_BYTES})"
+        logger.error(error_msg)
+        raise ValueError(error_msg)
+
 
 def generate_job_id():
     """Generate job ID in format YYYYMMDDhhmmss (JST)"""
     return datetime.now(JST).strftime('%Y%m%d%H%M%S')
 
 
+def submit_put_text_objects(objects, content_type):
+    """
+    テキストオブジェクトのS3保存を共有エグゼキュータに投入する
+    
+    Args:
+        objects: [(key, text), ...]
+        content_type: ContentTypeヘッダ
+    
+    Returns:
+        list: 各put_objectのFuture（result()で完了待ち・例外伝播）
+    """
+    # str のBodyはbotocoreがシリアライズ時に1回だけUTF-8エンコードする
+    return [
+        _EXECUTOR.submit(
+            s3_client.put_object,
+            Bucket=S3_BUCKET,
+            Key=key,
+            Body=text,
+            ContentType=content_type
+        )
+        for key, text in objects
+    ]
+
+
+def _attr(value):
+    """文字列はそのままAttributeValueに、それ以外はTypeSerializerで変換"""
+    if type(value) is str:
+        return {'S': value}
+    return _serializer.serialize(value)
+
+
+def batch_put_job_items(job_id, folder_path, pdf_files, attributes):
+    """
+    ジョブ項目をBatchWriteItemで一括登録（共通属性は1回だけマーシャリング）
+    
+    Args:
+        job_id: "20251105120000"
+        folder_path: "フォルダ1/フォルダ1-1"
+        pdf_files: [{"file_key": "...", "file_name": "..."}]
+        attributes: 全項目共通の属性 {"status": "queued", ...}
+    """
+    common = {name: _serializer.serialize(value) for name, value in attributes.items()}
+    common['job_id'] = {'S': job_id}
+    common['folder_path'] = {'S': folder_path}
+    
+    # 同一キーはバッチ内で重複できないため後勝ちで1件にまとめる
+    items = {}
+    for pdf in pdf_files:
+        sort_key = f"{folder_path}#{pdf['file_name']}"
+        items[sort_key] = {
+            **common,
+            'folder_path#file_name': {'S': sort_key},
+            'file_name': _attr(pdf['file_name']),
+            'file_key': _attr(pdf['file_key'])
+        }
+    
+    requests = [{'PutRequest': {'Item': item}} for item in items.values()]
+    for start in range(0, len(requests), BATCH_WRITE_SIZE):
+        request_items = {DYNAMODB_TABLE: requests[start:start + BATCH_WRITE_SIZE]}
+        for attempt in range(BATCH_WRITE_MAX_RETRIES + 1):
+            if attempt:
+                time.sleep(min(0.05 * (2 ** (attempt - 1)), 1.0))
+            response = dynamodb_client.batch_write_item(RequestItems=request_items)
+            request_items = response.get('UnprocessedItems')
+            if not request_items:
+                break
+        else:
+            raise RuntimeError(f"Failed to write {len(request_items[DYNAMODB_TABLE])} job items after retries")
+
+
+def _head_pdf_file(folder_path, file_name):
+    """指定PDFの存在をhead_objectで確認（存在しなければNone）"""
+    key = f"PDF/{folder_path}/{file_name}"
+    try:
+        s3_client.head_object(Bucket=S3_BUCKET, Key=key)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey'):
+            return None
+        raise
+    return {
+        'file_key': key,
+        'folder_path': folder_path,
+        'file_name': file_name
+    }
+
+
+def _head_pdf_files(folder_path, specific_files):
+    """指定ファイルのみhead_objectで並列に確認（キー順）"""
+    file_names = sorted({
+        name for name in specific_files
+        if name.endswith('.pdf') and '/' not in name
+    })
+    logger.info(f"Checking {len(file_names)} requested PDF files in: PDF/{folder_path}/")
+    return [
+        pdf_file for pdf_file in _EXECUTOR.map(lambda name: _head_pdf_file(folder_path, name), file_names)
+        if pdf_file
+    ]
+
+
+def _list_pdf_files(folder_path, delimiter=None):
+    """
+    フォルダ配下のPDFをLIST（delimiter='/' 指定時は直下のみ＋子フォルダ有無も判定）
+    
+    Returns:
+        (pdf_files, has_children)
+    """
+    prefix = f"PDF/{folder_path}/"
+    logger.info(f"Searching for PDF files in: {prefix}")
+    
+    pdf_files = []
+    has_children = False
+    paginator = s3_client.get_paginator('list_objects_v2')
+    list_params = {'Bucket': S3_BUCKET, 'Prefix': prefix, 'PaginationConfig': {'PageSize': 1000}}
+    if delimiter:
+        list_params['Delimiter'] = delimiter
+    
+    for page in paginator.paginate(**list_params):
+        # CommonPrefixes があれば子フォルダが存在
+        if page.get('CommonPrefixes'):
+            has_children = True
+        
+        for obj in page.get('Contents', []):
+            key = obj['Key']
+            
+            # PDFファイルのみ対象
+            if not key.endswith('.pdf'):
+                continue
+            
+            pdf_files.append({
+                'file_key': key,
+                'folder_path': folder_path,
+                'file_name': key.split('/')[-1]
+            })
+    
+    return pdf_files, has_children
+
+
 def get_pdf_files_in_folder(folder_path, specific_files=None):
     """
     指定フォルダ配下のすべてのPDFファイルを取得（階層対応）
     
+    specific_files 指定時はLISTせず、指定ファイルのみhead_objectで並列に確認する。
+    
     Args:
         folder_path: "フォルダ1/フォルダ1-1" (先頭の PDF/ は含めない)
         specific_files: Optional list of specific file names to filter
@@ -62,36 +273,10 @@ def get_pdf_files_in_folder(folder_path, specific_files=None):
         ]
     """
     try:
-        # S3 Prefix を構築
-        prefix = f"PDF/{folder_path}/"
-        logger.info(f"Searching for PDF files in: {prefix}")
-        
-        pdf_files = []
-        paginator = s3_client.get_paginator('list_objects_v2')
-        
-        for page in paginator.paginate(Bucket=S3_BUCKET, Prefix=prefix):
-            if 'Contents' not in page:
-                continue
-                
-            for obj in page['Contents']:
-                key = obj['Key']
-                
-                # PDFファイルのみ対象
-                if not key.endswith('.pdf'):
-                    continue
-                
-                # ファイル名を抽出
-                file_name = key.split('/')[-1]
-                
-                # specific_files が指定されている場合、フィルター
-                if specific_files and file_name not in specific_files:
-                    continue
-                
-                pdf_files.append({
-                    'file_key': key,
-                    'folder_path': folder_path,
-                    'file_name': file_name
-                })
+        if specific_files:
+            pdf_files = _head_pdf_files(folder_path, specific_files)
+        else:
+            pdf_files, _ = _list_pdf_files(folder_path)
         
         logger.info(f"Found {len(pdf_files)} PDF files in {folder_path}")
         return pdf_files
@@ -101,6 +286,35 @@ def get_pdf_files_in_folder(folder_path, specific_files=None):
         return []
 
 
+def get_leaf_folder_pdf_files(folder_path, specific_files=None):
+    """
+    ジョブ作成用: 直下のPDF一覧と子フォルダ有無を1回のLISTで取得
+    
+    specific_files 指定時はhead_objectによる確認と子フォルダ確認を並行して行う。
+    
+    Args:
+        folder_path: "フォルダ1/フォルダ1-1" (先頭の PDF/ は含めない)
+        specific_files: Optional list of specific file names to filter
+    
+    Returns:
+        (pdf_files, has_children)
+    """
+    try:
+        if specific_files:
+            children_future = _EXECUTOR.submit(check_folder_has_children, folder_path)
+            pdf_files = _head_pdf_files(folder_path, specific_files)
+            has_children = children_future.result()
+        else:
+            pdf_files, has_children = _list_pdf_files(folder_path, delimiter='/')
+        
+        logger.info(f"Found {len(pdf_files)} PDF files in {folder_path} (has children: {has_children})")
+        return pdf_files, has_children
+        
+    except ClientError as e:
+        logger.error(f"Error listing PDF files in folder {folder_path}: {e}")
+        return [], False
+
+
 def check_folder_has_children(folder_path):
     """
     フォルダが子フォルダを持つかチェック
@@ -133,7 +347,7 @@ def check_folder_has_children(folder_path):
         return False
 
 
-def register_job_in_dynamodb(job_id, folder_path, pdf_files, processing_mode='full'):
+def register_job_in_dynamodb(job_id, folder_path, pdf_files, processing_mode='full', request_ts=None):
     """
     ジョブ登録（複合キー対応）
     
@@ -149,26 +363,18 @@ def register_job_in_dynamodb(job_id, folder_path, pdf_files, processing_mode='fu
             ...
         ]
         processing_mode: "full", "reknowledge", or "direct_pdf" (default: "full")
+        request_ts: リクエスト単位で1回だけ計算したタイムスタンプ（未指定なら現在時刻）
     """
     try:
-        for pdf_file in pdf_files:
-            file_name = pdf_file['file_name']
-            file_key = pdf_file['file_key']
-            
-            # 複合キー: job_id (PK) + folder_path#file_name (SK)
-            jobs_table.put_item(
-                Item={
-                    'job_id': job_id,
-                    'folder_path#file_name': f"{folder_path}#{file_name}",
-                    'folder_path': folder_path,
-                    'file_name': file_name,
-                    'file_key': file_key,
-                    'status': 'queued',
-                    'processing_mode': processing_mode,
-                    'last_update': datetime.now(JST).isoformat(),
-                    'message': 'Job queued for processing'
-                }
-            )
+        ts = request_ts or datetime.now(JST).isoformat()
+        
+        # 複合キー: job_id (PK) + folder_path#file_name (SK)
+        batch_put_job_items(job_id, folder_path, pdf_files, {
+            'status': 'queued',
+            'processing_mode': processing_mode,
+            'last_update': ts,
+            'message': 'Job queued for processing'
+        })
         
         logger.info(f"Registered {len(pdf_files)} files in DynamoDB v2 for job {job_id}, folder {folder_path}")
         
@@ -181,7 +387,7 @@ def register_job_in_dynamodb(job_id, folder_path, pdf_files, processing_mode='fu
                     ExpressionAttributeNames={'#lu': 'last_update'},
                     ExpressionAttributeValues={
                         ':jid': job_id,
-                        ':ts': datetime.now(JST).isoformat()
+                        ':ts': ts
                     }
                 )
                 logger.info(f"Updated folder config: {folder_path} -> job_id {job_id}")
@@ -197,22 +403,58 @@ def register_job_in_dynamodb(job_id, folder_path, pdf_files, processing_mode='fu
         raise
 
 
-def set_default_job_id(folder_path, job_id):
+def query_job_files(job_id, folder_path):
+    """
+    既存ジョブのフォルダ配下ファイルを取得（全ページ、必要な属性のみ）
+    
+    Returns:
+        [{"file_name": "資料1.pdf", "file_key": "PDF/..."}]  (旧属性 pdf_name / pdf_key にも対応)
+    """
+    kwargs = {
+        'KeyConditionExpression': 'job_id = :jid AND begins_with(#sk, :folder_prefix)',
+        'ProjectionExpression': 'file_name, file_key, pdf_name, pdf_key',
+        'ExpressionAttributeNames': {'#sk': 'folder_path#file_name'},
+        'ExpressionAttributeValues': {
+            ':jid': job_id,
+            ':folder_prefix': folder_path + '#'
+        }
+    }
+    pdf_files = []
+    response = {}
+    
+    # ページごとに直接変換（中間の項目リストを作らない）
+    while True:
+        if 'LastEvaluatedKey' in response:
+            response = jobs_table.query(ExclusiveStartKey=response['LastEvaluatedKey'], **kwargs)
+        else:
+            response = jobs_table.query(**kwargs)
+        
+        pdf_files.extend(
+            {
+                'file_name': item.get('file_name') or item.get('pdf_name'),
+                'file_key': item.get('file_key') or item.get('pdf_key')
+            }
+            for item in response.get('Items', [])
+        )
+        
+        if 'LastEvaluatedKey' not in response:
+            return pdf_files
+
+
+def set_default_job_id(folder_path, job_id, request_ts=None):
     """
     フォルダのデフォルトJOB_IDを設定
     
     Args:
         folder_path: "生技資料/生技25"
         job_id: "20251106120000"
+        request_ts: リクエスト単位で1回だけ計算したタイムスタンプ（未指定なら現在時刻）
     """
     try:
-        if not DYNAMODB_FOLDER_CONFIG_TABLE:
+        if not folder_config_table:
             logger.error("DYNAMODB_FOLDER_CONFIG_TABLE not configured")
             return False
         
-        folder_config_table = dynamodb.Table(DYNAMODB_FOLDER_CONFIG_TABLE)
-        JST = timezone(timedelta(hours=9))
-        
         # update_item で既存属性を保護（latest_job_id などが消えないようにする）
         folder_config_table.update_item(
             Key={'folder_path': folder_path},
@@ -220,7 +462,7 @@ def set_default_job_id(folder_path, job_id):
             ExpressionAttributeNames={'#lu': 'last_update'},
             ExpressionAttributeValues={
                 ':djid': job_id,
-                ':ts': datetime.now(JST).isoformat()
+                ':ts': request_ts or datetime.now(JST).isoformat()
             }
         )
         logger.info(f"Set default job_id for folder {folder_path}: {job_id}")
@@ -242,12 +484,10 @@ def get_default_job_id(folder_path):
         job_id or None
     """
     try:
-        if not DYNAMODB_FOLDER_CONFIG_TABLE:
+        if not folder_config_table:
             logger.error("DYNAMODB_FOLDER_CONFIG_TABLE not configured")
             return None
         
-        folder_config_table = dynamodb.Table(DYNAMODB_FOLDER_CONFIG_TABLE)
-        
         response = folder_config_table.get_item(
             Key={'folder_path': folder_path}
         )
@@ -265,7 +505,74 @@ def get_default_job_id(folder_path):
         return None
 
 
-def start_step_functions_execution(job_id, folder_path, pdf_files, transcript_prompt, knowledge_prompt, processing_mode='full'):
+def get_default_job_ids(folder_paths):
+    """
+    複数フォルダのデフォルトJOB_IDをBatchGetItemでまとめて取得
+    
+    Args:
+        folder_paths: ["生技資料/生技25", ...]
+        
+    Returns:
+        {folder_path: job_id or None}
+    
+    Raises:
+        ClientError / RuntimeError: 取得失敗時（「デフォルト未設定」と区別するため握りつぶさない）
+    """
+    default_job_ids = dict.fromkeys(folder_paths)
+    if not folder_config_table:
+        logger.error("DYNAMODB_FOLDER_CONFIG_TABLE not configured")
+        return default_job_ids
+    
+    keys = [{'folder_path': folder_path} for folder_path in default_job_ids]
+    for start in range(0, len(keys), BATCH_GET_SIZE):
+        request_items = {
+            folder_config_table.name: {
+                'Keys': keys[start:start + BATCH_GET_SIZE],
+                'ProjectionExpression': 'folder_path, default_job_id'
+            }
+        }
+        for attempt in range(BATCH_GET_MAX_RETRIES + 1):
+            if attempt:
+                time.sleep(min(0.05 * (2 ** (attempt - 1)), 1.0))
+            response = dynamodb.batch_get_item(RequestItems=request_items)
+            for item in response.get('Responses', {}).get(folder_config_table.name, []):
+                default_job_ids[item['folder_path']] = item.get('default_job_id')
+            request_items = response.get('UnprocessedKeys')
+            if not request_items:
+                break
+        else:
+            raise RuntimeError(
+                f"Failed to read {len(request_items[folder_config_table.name]['Keys'])} folder configs after retries"
+            )
+    
+    logger.info(f"Found default job_ids for {sum(1 for job_id in default_job_ids.values() if job_id)}/{len(default_job_ids)} folders")
+    return default_job_ids
+
+
+def submit_prompt_saves(job_id, folder_path, transcript_prompt, knowledge_prompt, processing_mode='full'):
+    """
+    プロンプトのS3保存を開始（DynamoDB登録と並行させるため完了は待たない）
+    
+    Returns:
+        list: put_objectのFuture（direct_pdf モードでは空）
+    """
+    # Save prompts to S3 (only if not direct_pdf mode)
+    if processing_mode == 'direct_pdf':
+        logger.info(f"Skipping prompt save for direct_pdf mode")
+        return []
+    
+    # Save prompts to S3 (新パス: Prompts/{folder_path}/{job_id}/)
+    transcript_prompt_key = f"Prompts/{folder_path}/{job_id}/transcript_prompt.txt"
+    knowledge_prompt_key = f"Prompts/{folder_path}/{job_id}/knowledge_prompt.txt"
+    
+    logger.info(f"Saving prompts to S3 for job {job_id}, folder {folder_path}")
+    return submit_put_text_objects(
+        [(transcript_prompt_key, transcript_prompt), (knowledge_prompt_key, knowledge_prompt)],
+        'text/plain; charset=utf-8'
+    )
+
+
+def start_step_functions_execution(job_id, folder_path, pdf_files, transcript_prompt, knowledge_prompt, processing_mode='full', prompt_futures=None):
     """
     Start Step Functions execution for file processing
     
@@ -276,30 +583,17 @@ def start_step_functions_execution(job_id, folder_path, pdf_files, transcript_pr
         transcript_prompt: プロンプト文字列
         knowledge_prompt: プロンプト文字列
         processing_mode: "full", "reknowledge", or "direct_pdf" (default: "full")
+        prompt_futures: submit_prompt_saves() の戻り値（未指定ならここで保存を開始）
     """
     try:
-        # Save prompts to S3 (only if not direct_pdf mode)
-        if processing_mode != 'direct_pdf':
-            # Save prompts to S3 (新パス: Prompts/{folder_path}/{job_id}/)
-            transcript_prompt_key = f"Prompts/{folder_path}/{job_id}/transcript_prompt.txt"
-            knowledge_prompt_key = f"Prompts/{folder_path}/{job_id}/knowledge_prompt.txt"
-            
-            logger.info(f"Saving prompts to S3 for job {job_id}, folder {folder_path}")
-            s3_client.put_object(
-                Bucket=S3_BUCKET,
-                Key=transcript_prompt_key,
-                Body=transcript_prompt.encode('utf-8'),
-                ContentType='text/plain; charset=utf-8'
-            )
-            s3_client.put_object(
-                Bucket=S3_BUCKET,
-                Key=knowledge_prompt_key,
-                Body=knowledge_prompt.encode('utf-8'),
-                ContentType='text/plain; charset=utf-8'
-            )
-            logger.info(f"Saved prompts to S3: {transcript_prompt_key}, {knowledge_prompt_key}")
-        else:
-            logger.info(f"Skipping prompt save for direct_pdf mode")
+        if prompt_futures is None:
+            prompt_futures = submit_prompt_saves(job_id, folder_path, transcript_prompt, knowledge_prompt, processing_mode)
+        
+        # ワーカーがプロンプトを読むため、実行開始前に保存完了を待つ
+        for future in prompt_futures:
+            future.result()
+        if prompt_futures:
+            logger.info(f"Saved prompts to S3 for job {job_id}")
         
         # Prepare Step Functions input with folder_path
         file_items = []
@@ -322,15 +616,8 @@ def start_step_functions_execution(job_id, folder_path, pdf_files, transcript_pr
         }
         
         # Check input size
-        execution_input_str = json.dumps(execution_input, ensure_ascii=False)
-        input_size = len(execution_input_str.encode('utf-8'))
-        max_size = 262144
-        logger.info(f"Step Functions input size: {input_size} bytes (max: {max_size})")
-        
-        if input_size > max_size:
-            error_msg = f"Execution input too large: {input_size} bytes (max: {max_size})"
-            logger.error(error_msg)
-            raise ValueError(error_msg)
+        execution_input_str = _dumps(execution_input)
+        check_execution_input_size(execution_input_str)
         
         # Start Step Functions execution
         response = stepfunctions_client.start_execution(
@@ -351,6 +638,283 @@ def start_step_functions_execution(job_id, folder_path, pdf_files, transcript_pr
         raise
 
 
+def parse_body(event):
+    """API Gatewayのbody（JSON文字列）を解析。直接呼び出し時はイベント自体をbodyとして扱う"""
+    return json.loads(event.get('body', '{}')) if isinstance(event.get('body'), str) else event
+
+
+def handle_get_folders(event, request_ts):
+    """GET /api/folders - フォルダツリー取得"""
+    # folder_tree_helper は独自のS3クライアントを生成するため、このルートでのみ読み込む
+    from folder_tree_helper import get_folder_tree
+    
+    folder_tree = get_folder_tree()
+    return json_response(200, folder_tree)  # 大きなツリーのため空白なし
+
+
+def handle_list_pdfs(event, request_ts):
+    """GET /list-pdfs - フォルダ内のPDF一覧取得"""
+    logger.info(f"list-pdfs request - full event: {json.dumps(event, ensure_ascii=False)}")
+    query_params = event.get('queryStringParameters', {}) or {}
+    logger.info(f"Query parameters: {query_params}")
+    folder_path = query_params.get('folder_path', '')
+    logger.info(f"Extracted folder_path: '{folder_path}'")
+    
+    if not folder_path:
+        return json_response(400, {'error': 'folder_path is required'})
+    
+    pdf_files = get_pdf_files_in_folder(folder_path)
+    file_names = [pdf['file_name'] for pdf in pdf_files]
+    
+    return json_response(200, {
+        'files': file_names,
+        'count': len(file_names)
+    })
+
+
+def handle_set_default_job(event, request_ts):
+    """POST /api/default-job - デフォルトJOB_IDの設定"""
+    body = parse_body(event)
+    folder_path = body.get('folder_path', '')
+    job_id = body.get('job_id', '')
+    
+    if not folder_path or not job_id:
+        return json_response(400, {'error': 'folder_path and job_id are required'})
+    
+    if not set_default_job_id(folder_path, job_id, request_ts):
+        return json_response(500, {'error': 'Failed to set default job_id'})
+    
+    return json_response(200, {
+        'message': 'Default job_id set successfully',
+        'folder_path': folder_path,
+        'job_id': job_id
+    })
+
+
+def handle_get_default_job(event, request_ts):
+    """
+    GET /api/default-job?folder_path=xxx - デフォルトJOB_IDの取得
+    folder_path を複数指定した場合は {"job_ids": {folder_path: job_id}} を1回のBatchGetItemで返す
+    """
+    query_params = event.get('queryStringParameters', {}) or {}
+    folder_path = query_params.get('folder_path', '')
+    folder_paths = [
+        p for p in ((event.get('multiValueQueryStringParameters') or {}).get('folder_path') or []) if p
+    ]
+    
+    if len(folder_paths) > 1:
+        try:
+            job_ids = get_default_job_ids(folder_paths)
+        except (ClientError, RuntimeError) as e:
+            logger.error(f"Error getting default job_ids: {e}")
+            return json_response(500, {
+                'error': 'Failed to get default job_ids',
+                'message': str(e)
+            })
+        return json_response(200, {'job_ids': job_ids})
+    
+    if not folder_path:
+        return json_response(400, {'error': 'folder_path is required'})
+    
+    return json_response(200, {
+        'folder_path': folder_path,
+        'job_id': get_default_job_id(folder_path)
+    })
+
+
+def handle_reknowledge(event, request_ts):
+    """POST /api/reknowledge - 既存ジョブのナレッジ再生成（新しいjob_idで）"""
+    body = parse_body(event)
+    source_job_id = body.get('job_id', '').strip()  # 元のjob_id
+    folder_path = (body.get('folder_path', '') or '').strip()
+    knowledge_prompt = body.get('knowledge_prompt', '')
+    
+    if not source_job_id or not folder_path or not knowledge_prompt:
+        return json_response(400, {
+            'error': 'job_id (source), folder_path, and knowledge_prompt are required'
+        })
+    
+    logger.info(f"Reknowledge request: source_job_id={source_job_id}, folder_path={folder_path}")
+    
+    # Get existing job items from DynamoDB
+    try:
+        pdf_files = query_job_files(source_job_id, folder_path)
+        
+        if not pdf_files:
+            return json_response(404, {
+                'error': f'No job found for source_job_id={source_job_id}, folder_path={folder_path}'
+            })
+        
+        # Generate new job_id
+        new_job_id = generate_job_id()
+        logger.info(f"Generated new job_id for reknowledge: {new_job_id}")
+        
+        # Step Functions入力を1パスで構築し、書き込み前にサイズを検証（KB sync は最後のファイルのみ）
+        execution_input_str = None
+        if STATE_MACHINE_ARN:
+            last_index = len(pdf_files) - 1
+            execution_input_str = _dumps({
+                'files': [
+                    {
+                        'mode': 'reknowledge',
+                        'job_id': new_job_id,
+                        'source_job_id': source_job_id,
+                        'folder_path': folder_path,
+                        'file_name': pdf['file_name'],
+                        'trigger_kb_sync': index == last_index
+                    }
+                    for index, pdf in enumerate(pdf_files)
+                ]
+            })
+            check_execution_input_size(execution_input_str)
+        
+        # Save prompts to S3 for new job_id
+        source_transcript_prompt_key = f"Prompts/{folder_path}/{source_job_id}/transcript_prompt.txt"
+        transcript_prompt_key = f"Prompts/{folder_path}/{new_job_id}/transcript_prompt.txt"
+        knowledge_prompt_key = f"Prompts/{folder_path}/{new_job_id}/knowledge_prompt.txt"
+        
+        # transcript_promptは元ジョブからサーバーサイドコピー（本文をLambdaに通さない）
+        # 元プロンプトが無い場合は他の書き込み前にここで失敗する
+        s3_client.copy_object(
+            Bucket=S3_BUCKET,
+            Key=transcript_prompt_key,
+            CopySource={'Bucket': S3_BUCKET, 'Key': source_transcript_prompt_key},
+            ContentType='text/plain',
+            MetadataDirective='REPLACE'
+        )
+        
+        # knowledge_promptの保存はDynamoDB登録と並行して実行
+        prompt_futures = submit_put_text_objects([(knowledge_prompt_key, knowledge_prompt)], 'text/plain')
+        
+        # Register new job in DynamoDB with status='reknowledge'
+        batch_put_job_items(new_job_id, folder_path, pdf_files, {
+            'status': 'reknowledge',
+            'message': f'Waiting for reknowledge processing from source {source_job_id}',
+            'processing_mode': 'reknowledge',
+            'source_job_id': source_job_id,
+            'last_update': request_ts
+        })
+        
+        logger.info(f"Registered {len(pdf_files)} files for reknowledge job: {new_job_id}")
+        
+        for future in prompt_futures:
+            future.result()
+        logger.info(f"Saved prompts for new job: {new_job_id}")
+        
+        # Start Step Functions execution for reknowledge mode
+        execution_arn = None
+        if execution_input_str:
+            response_sf = stepfunctions_client.start_execution(
+                stateMachineArn=STATE_MACHINE_ARN,
+                name=f"{new_job_id}-reknowledge",
+                input=execution_input_str
+            )
+            execution_arn = response_sf['executionArn']
+            logger.info(f"Started Step Functions execution: {execution_arn}")
+        
+        return json_response(202, {
+            'job_id': new_job_id,
+            'source_job_id': source_job_id,
+            'folder_path': folder_path,
+            'file_count': len(pdf_files),
+            'execution_arn': execution_arn,
+            'message': 'Reknowledge job started with new job_id'
+        })
+        
+    except Exception as e:
+        logger.error(f"Error in reknowledge: {e}", exc_info=True)
+        return json_response(500, {
+            'error': 'Failed to process reknowledge request',
+            'message': str(e)
+        })
+
+
+def handle_create_job(event, request_ts):
+    """POST /api/job - ジョブ作成"""
+    # Parse request
+    body = parse_body(event)
+    folder_path = (body.get('folder_path', '') or '').strip()
+    transcript_prompt = body.get('transcript_prompt', '')
+    knowledge_prompt = body.get('knowledge_prompt', '')
+    requested_pdf_files = body.get('pdfFiles', [])  # Optional: specific files
+    processing_mode = body.get('processing_mode', 'full').strip()  # New parameter
+    
+    # Validate processing_mode
+    valid_modes = ['full', 'direct_pdf']
+    if processing_mode not in valid_modes:
+        return json_response(400, {
+            'error': f'Invalid processing_mode. Must be one of: {valid_modes}'
+        })
+    
+    # Validate required parameters
+    if not folder_path:
+        return json_response(400, {
+            'error': 'folder_path is required'
+        })
+    
+    # Prompts are optional for direct_pdf mode
+    if processing_mode != 'direct_pdf' and (not transcript_prompt or not knowledge_prompt):
+        return json_response(400, {
+            'error': 'transcript_prompt and knowledge_prompt are required for non-direct_pdf modes'
+        })
+    
+    # Get PDF files in folder (子フォルダ有無も同じLISTで判定)
+    pdf_files, has_children = get_leaf_folder_pdf_files(
+        folder_path, requested_pdf_files if requested_pdf_files else None
+    )
+    
+    # Check if folder has child folders (must be leaf folder)
+    if has_children:
+        return json_response(400, {
+            'error': 'Selected folder has child folders. Please select a leaf folder only.'
+        })
+    
+    if not pdf_files:
+        return json_response(400, {
+            'error': f'No PDF files found in folder: {folder_path}'
+        })
+    
+    # Generate job ID
+    job_id = generate_job_id()
+    logger.info(f"Generated job ID: {job_id} for folder_path: {folder_path}")
+    
+    # Save prompts to S3 concurrently with the DynamoDB registration
+    prompt_futures = submit_prompt_saves(job_id, folder_path, transcript_prompt, knowledge_prompt, processing_mode)
+    
+    # Register job in DynamoDB
+    register_job_in_dynamodb(job_id, folder_path, pdf_files, processing_mode, request_ts)
+    
+    # Start Step Functions execution
+    execution_arn = start_step_functions_execution(
+        job_id, folder_path, pdf_files, transcript_prompt, knowledge_prompt, processing_mode,
+        prompt_futures=prompt_futures
+    )
+    
+    return json_response(202, {
+        'job_id': job_id,
+        'folder_path': folder_path,
+        'pdf_count': len(pdf_files),
+        'execution_arn': execution_arn,
+        'message': 'Job started via Step Functions'
+    })
+
+
+# (method, path) -> handler。/api なしの旧パスも同じハンドラに割り当てる
+ROUTES = {
+    ('GET', '/api/folders'): handle_get_folders,
+    ('GET', '/list-pdfs'): handle_list_pdfs,
+    ('GET', '/api/list-pdfs'): handle_list_pdfs,
+    ('POST', '/default-job'): handle_set_default_job,
+    ('POST', '/api/default-job'): handle_set_default_job,
+    ('GET', '/default-job'): handle_get_default_job,
+    ('GET', '/api/default-job'): handle_get_default_job,
+    ('POST', '/reknowledge'): handle_reknowledge,
+    ('POST', '/api/reknowledge'): handle_reknowledge,
+    ('POST', '/job'): handle_create_job,
+    ('POST', '/api/job'): handle_create_job,
+}
+
+
 def lambda_handler(event, context):
     """
     Main Lambda handler for job creation (v2 - hierarchical structure only)
@@ -358,6 +922,7 @@ def lambda_handler(event, context):
     Routes:
     - GET /api/folders: Get folder tree structure
     - GET /list-pdfs?folder_path=xxx: List PDFs in a folder
+    - POST/GET /api/default-job: Set / get default job_id of a folder
     - POST /api/job: Creates processing job with folder_path
     - POST /api/reknowledge: Re-generate knowledge for existing job
     
@@ -383,400 +948,27 @@ def lambda_handler(event, context):
         
         logger.info(f"Request: {http_method} {path}")
         
-        # GET /api/folders - フォルダツリー取得
-        if http_method == 'GET' and path == '/api/folders':
-            folder_tree = get_folder_tree()
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps(folder_tree, ensure_ascii=False)
-            }
+        # DynamoDBに書き込むタイムスタンプはリクエスト単位で1回だけ計算
+        request_ts = datetime.now(JST).isoformat()
         
-        # GET /list-pdfs - フォルダ内のPDF一覧取得
-        if http_method == 'GET' and (path == '/list-pdfs' or path == '/api/list-pdfs'):
-            logger.info(f"list-pdfs request - full event: {json.dumps(event, ensure_ascii=False)}")
-            query_params = event.get('queryStringParameters', {}) or {}
-            logger.info(f"Query parameters: {query_params}")
-            folder_path = query_params.get('folder_path', '')
-            logger.info(f"Extracted folder_path: '{folder_path}'")
-            
-            if not folder_path:
-                return {
-                    'statusCode': 400,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({'error': 'folder_path is required'})
-                }
-            
-            pdf_files = get_pdf_files_in_folder(folder_path)
-            file_names = [pdf['file_name'] for pdf in pdf_files]
-            
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'files': file_names,
-                    'count': len(file_names)
-                }, ensure_ascii=False)
-            }
+        # Route dispatch（例外は下の except で 500 に変換）
+        handler = ROUTES.get((http_method, path))
+        if handler is not None:
+            return handler(event, request_ts)
         
-        # POST /api/default-job - デフォルトJOB_IDの設定
-        if http_method == 'POST' and (path == '/default-job' or path == '/api/default-job'):
-            body = json.loads(event.get('body', '{}')) if isinstance(event.get('body'), str) else event
-            folder_path = body.get('folder_path', '')
-            job_id = body.get('job_id', '')
-            
-            if not folder_path or not job_id:
-                return {
-                    'statusCode': 400,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({'error': 'folder_path and job_id are required'})
-                }
-            
-            success = set_default_job_id(folder_path, job_id)
-            
-            if success:
-                return {
-                    'statusCode': 200,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({
-                        'message': 'Default job_id set successfully',
-                        'folder_path': folder_path,
-                        'job_id': job_id
-                    }, ensure_ascii=False)
-                }
-            else:
-                return {
-                    'statusCode': 500,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({'error': 'Failed to set default job_id'})
-                }
-        
-        # GET /api/default-job?folder_path=xxx - デフォルトJOB_IDの取得
-        if http_method == 'GET' and (path == '/default-job' or path == '/api/default-job'):
-            query_params = event.get('queryStringParameters', {}) or {}
-            folder_path = query_params.get('folder_path', '')
-            
-            if not folder_path:
-                return {
-                    'statusCode': 400,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({'error': 'folder_path is required'})
-                }
-            
-            job_id = get_default_job_id(folder_path)
-            
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'folder_path': folder_path,
-                    'job_id': job_id
-                }, ensure_ascii=False)
-            }
-        
-        # POST /api/reknowledge - 既存ジョブのナレッジ再生成（新しいjob_idで）
-        if http_method == 'POST' and (path == '/reknowledge' or path == '/api/reknowledge'):
-            body = json.loads(event.get('body', '{}')) if isinstance(event.get('body'), str) else event
-            source_job_id = body.get('job_id', '').strip()  # 元のjob_id
-            folder_path = (body.get('folder_path', '') or '').strip()
-            knowledge_prompt = body.get('knowledge_prompt', '')
-            
-            if not source_job_id or not folder_path or not knowledge_prompt:
-                return {
-                    'statusCode': 400,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({
-                        'error': 'job_id (source), folder_path, and knowledge_prompt are required'
-                    })
-                }
-            
-            logger.info(f"Reknowledge request: source_job_id={source_job_id}, folder_path={folder_path}")
-            
-            # Get existing job items from DynamoDB
-            try:
-                response = jobs_table.query(
-                    KeyConditionExpression='job_id = :jid AND begins_with(#sk, :folder_prefix)',
-                    ExpressionAttributeNames={'#sk': 'folder_path#file_name'},
-                    ExpressionAttributeValues={
-                        ':jid': source_job_id,
-                        ':folder_prefix': folder_path + '#'
-                    }
-                )
-                
-                job_items = response.get('Items', [])
-                
-                if not job_items:
-                    return {
-                        'statusCode': 404,
-                        'headers': {
-                            'Content-Type': 'application/json',
-                            'Access-Control-Allow-Origin': '*'
-                        },
-                        'body': json.dumps({
-                            'error': f'No job found for source_job_id={source_job_id}, folder_path={folder_path}'
-                        })
-                    }
-                
-                # Generate new job_id
-                new_job_id = generate_job_id()
-                logger.info(f"Generated new job_id for reknowledge: {new_job_id}")
-                
-                # Get source transcript_prompt from S3
-                source_transcript_prompt_key = f"Prompts/{folder_path}/{source_job_id}/transcript_prompt.txt"
-                transcript_prompt_obj = s3_client.get_object(Bucket=S3_BUCKET, Key=source_transcript_prompt_key)
-                transcript_prompt = transcript_prompt_obj['Body'].read().decode('utf-8')
-                
-                # Save prompts to S3 for new job_id
-                transcript_prompt_key = f"Prompts/{folder_path}/{new_job_id}/transcript_prompt.txt"
-                knowledge_prompt_key = f"Prompts/{folder_path}/{new_job_id}/knowledge_prompt.txt"
-                
-                s3_client.put_object(
-                    Bucket=S3_BUCKET,
-                    Key=transcript_prompt_key,
-                    Body=transcript_prompt.encode('utf-8'),
-                    ContentType='text/plain'
-                )
-                s3_client.put_object(
-                    Bucket=S3_BUCKET,
-                    Key=knowledge_prompt_key,
-                    Body=knowledge_prompt.encode('utf-8'),
-                    ContentType='text/plain'
-                )
-                logger.info(f"Saved prompts for new job: {new_job_id}")
-                
-                # Register new job items in DynamoDB with status='reknowledge'
-                pdf_files = []
-                for item in job_items:
-                    file_name = item.get('file_name') or item.get('pdf_name')
-                    file_key = item.get('file_key') or item.get('pdf_key')
-                    pdf_files.append({
-                        'file_name': file_name,
-                        'file_key': file_key
-                    })
-                
-                # Register new job in DynamoDB
-                for pdf in pdf_files:
-                    sort_key = f"{folder_path}#{pdf['file_name']}"
-                    jobs_table.put_item(Item={
-                        'job_id': new_job_id,
-                        'folder_path#file_name': sort_key,
-                        'file_name': pdf['file_name'],
-                        'file_key': pdf['file_key'],
-                        'folder_path': folder_path,
-                        'status': 'reknowledge',
-                        'message': f'Waiting for reknowledge processing from source {source_job_id}',
-                        'processing_mode': 'reknowledge',
-                        'source_job_id': source_job_id,
-                        'last_update': datetime.now(JST).isoformat()
-                    })
-                
-                logger.info(f"Registered {len(pdf_files)} files for reknowledge job: {new_job_id}")
-                
-                # Start Step Functions execution for reknowledge mode
-                file_items = []
-                for pdf in pdf_files:
-                    file_items.append({
-                        'mode': 'reknowledge',
-                        'job_id': new_job_id,
-                        'source_job_id': source_job_id,
-                        'folder_path': folder_path,
-                        'file_name': pdf['file_name'],
-                        'trigger_kb_sync': False
-                    })
-                
-                # Add KB sync flag to the last item
-                if file_items:
-                    file_items[-1]['trigger_kb_sync'] = True
-                
-                execution_input = {
-                    'files': file_items
-                }
-                
-                execution_arn = None
-                if STATE_MACHINE_ARN:
-                    response_sf = stepfunctions_client.start_execution(
-                        stateMachineArn=STATE_MACHINE_ARN,
-                        name=f"{new_job_id}-reknowledge",
-                        input=json.dumps(execution_input)
-                    )
-                    execution_arn = response_sf['executionArn']
-                    logger.info(f"Started Step Functions execution: {execution_arn}")
-                
-                return {
-                    'statusCode': 202,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({
-                        'job_id': new_job_id,
-                        'source_job_id': source_job_id,
-                        'folder_path': folder_path,
-                        'file_count': len(pdf_files),
-                        'execution_arn': execution_arn,
-                        'message': 'Reknowledge job started with new job_id'
-                    })
-                }
-                
-            except Exception as e:
-                logger.error(f"Error in reknowledge: {e}", exc_info=True)
-                return {
-                    'statusCode': 500,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({
-                        'error': 'Failed to process reknowledge request',
-                        'message': str(e)
-                    })
-                }
-        
-        # POST /api/job - ジョブ作成
-        if http_method == 'POST' and (path == '/job' or path == '/api/job'):
-            # Parse request
-            body = json.loads(event.get('body', '{}')) if isinstance(event.get('body'), str) else event
-            folder_path = (body.get('folder_path', '') or '').strip()
-            transcript_prompt = body.get('transcript_prompt', '')
-            knowledge_prompt = body.get('knowledge_prompt', '')
-            requested_pdf_files = body.get('pdfFiles', [])  # Optional: specific files
-            processing_mode = body.get('processing_mode', 'full').strip()  # New parameter
-            
-            # Validate processing_mode
-            valid_modes = ['full', 'direct_pdf']
-            if processing_mode not in valid_modes:
-                return {
-                    'statusCode': 400,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({
-                        'error': f'Invalid processing_mode. Must be one of: {valid_modes}'
-                    })
-                }
-            
-            # Validate required parameters
-            if not folder_path:
-                return {
-                    'statusCode': 400,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({
-                        'error': 'folder_path is required'
-                    })
-                }
-            
-            # Prompts are optional for direct_pdf mode
-            if processing_mode != 'direct_pdf' and (not transcript_prompt or not knowledge_prompt):
-                return {
-                    'statusCode': 400,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({
-                        'error': 'transcript_prompt and knowledge_prompt are required for non-direct_pdf modes'
-                    })
-                }
-            
-            # Check if folder has child folders (must be leaf folder)
-            if check_folder_has_children(folder_path):
-                return {
-                    'statusCode': 400,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({
-                        'error': 'Selected folder has child folders. Please select a leaf folder only.'
-                    })
-                }
-            
-            # Generate job ID
-            job_id = generate_job_id()
-            logger.info(f"Generated job ID: {job_id} for folder_path: {folder_path}")
-            
-            # Get PDF files in folder
-            pdf_files = get_pdf_files_in_folder(folder_path, requested_pdf_files if requested_pdf_files else None)
-            
-            if not pdf_files:
-                return {
-                    'statusCode': 400,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({
-                        'error': f'No PDF files found in folder: {folder_path}'
-                    })
-                }
-            
-            # Register job in DynamoDB
-            register_job_in_dynamodb(job_id, folder_path, pdf_files, processing_mode)
-            
-            # Start Step Functions execution
-            execution_arn = start_step_functions_execution(
-                job_id, folder_path, pdf_files, transcript_prompt, knowledge_prompt, processing_mode
-            )
-            
-            return {
-                'statusCode': 202,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'job_id': job_id,
-                    'folder_path': folder_path,
-                    'pdf_count': len(pdf_files),
-                    'execution_arn': execution_arn,
-                    'message': 'Job started via Step Functions'
-                })
-            }
+        # Unknown route
+        return json_response(404, {
+            'error': 'Not found',
+            'message': f'Route not found: {http_method} {path}'
+        })
     
     except Exception as e:
         logger.error(f"Unexpected error: {e}", exc_info=True)
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'error': 'Internal server error',
-                'message': str(e)
-            })
-        }
+        return json_response(500, {
+            'error': 'Internal server error',
+            'message': str(e)
+        })
+
 
 def generate_presigned_url(bucket_name, object_key, expiration=3600):
     """署名付きURL生成"""
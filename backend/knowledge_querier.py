@@ -624,6 +624,7 @@ def save_chat_message(job_id, role, content, sources=None, chat_session_id=None,
         'message_id': message_id,
         'role': role,  # 'user' or 'assistant'
         'content': content,
+        'content_lc': content.lower(),  # 履歴検索用（DynamoDB の contains は大文字小文字を区別するため）
         'timestamp': timestamp,
         'ttl': int((datetime.now(JST) + timedelta(days=30)).timestamp())  # 30-day TTL
     }
@@ -1136,8 +1137,10 @@ def handle_async_query(event, query_id):
         }
         
         if assistant_message_id:
-            update_expression += ', message_id = :message_id'
+            # job_id of the saved message (history table partition key) for direct feedback updates
+            update_expression += ', message_id = :message_id, message_job_id = :message_job_id'
             expression_values[':message_id'] = assistant_message_id
+            expression_values[':message_job_id'] = effective_job_id
         
         query_status_table.update_item(
             Key={'query_id': query_id},
@@ -111,6 +111,8 @@ def lambda_handler(event, context):
             # Include message_id for feedback functionality
             if item.get('message_id'):
                 result['message_id'] = item.get('message_id')
+            if item.get('message_job_id'):
+                result['message_job_id'] = item.get('message_job_id')
         elif status == 'failed':
             result['error'] = item.get('error', 'Unknown error')
         
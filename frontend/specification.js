@@ -980,22 +980,35 @@ class KnowledgeQueryApp {
         // フォルダごとのデフォルトJOB_IDを格納
         this.folderDefaultJobIds = {};
         
-        for (const folderPath of this.selectedFolderPaths) {
-            try {
-                const response = await this.apiRequest(`${this.apiEndpoint}/default-job?folder_path=${encodeURIComponent(folderPath)}`, {
-                    method: 'GET'
-                });
-                
-                if (response.ok) {
-                    const data = await response.json();
-                    if (data.job_id) {
-                        this.folderDefaultJobIds[folderPath] = data.job_id;
-                        console.log(`[loadDefaultJobIdsForFolders] Folder: ${folderPath}, Default JOB_ID: ${data.job_id}`);
+        if (this.selectedFolderPaths.length === 0) {
+            return;
+        }
+        
+        // 全フォルダ分を1リクエストで取得（folder_path を複数指定）
+        const query = this.selectedFolderPaths
+            .map(folderPath => `folder_path=${encodeURIComponent(folderPath)}`)
+            .join('&');
+        
+        try {
+            const response = await this.apiRequest(`${this.apiEndpoint}/default-job?${query}`, {
+                method: 'GET'
+            });
+            
+            if (response.ok) {
+                const data = await response.json();
+                const jobIds = data.job_ids || { [data.folder_path]: data.job_id };
+                for (const [folderPath, jobId] of Object.entries(jobIds)) {
+                    if (jobId) {
+                        this.folderDefaultJobIds[folderPath] = jobId;
+                        console.log(`[loadDefaultJobIdsForFolders] Folder: ${folderPath}, Default JOB_ID: ${jobId}`);
                     }
                 }
-            } catch (error) {
-                console.error(`[loadDefaultJobIdsForFolders] Error loading default job_id for ${folderPath}:`, error);
+            } else {
+                // 取得失敗は「デフォルト未設定」ではないためエラーとして記録
+                console.error(`[loadDefaultJobIdsForFolders] Failed to load default job_ids: HTTP ${response.status}`);
             }
+        } catch (error) {
+            console.error('[loadDefaultJobIdsForFolders] Error loading default job_ids:', error);
         }
     }
     
@@ -1354,11 +1367,12 @@ class KnowledgeQueryApp {
                     const answer = statusData.answer || '';
                     const sources = statusData.sources || [];
                     const messageId = statusData.message_id || null;
+                    const messageJobId = statusData.message_job_id || null;
                     
                     console.log('[submitQuery] Query completed successfully, message_id:', messageId);
                     
                     // Add assistant message with backend message_id
-                    this.addChatMessage('assistant', answer, sources, messageId);
+                    this.addChatMessage('assistant', answer, sources, messageId, messageJobId);
                     
                     // Update PDF list if sources are returned
                     if (sources.length > 0) {
@@ -1390,7 +1404,7 @@ class KnowledgeQueryApp {
         }
     }
     
-    addChatMessage(role, content, sources = null, messageId = null) {
+    addChatMessage(role, content, sources = null, messageId = null, jobId = null) {
         console.log('[addChatMessage] Adding message:', role, 'messageId:', messageId);
         
         // Generate messageId for assistant messages if not provided
@@ -1404,7 +1418,8 @@ class KnowledgeQueryApp {
             content: content,
             sources: sources,
             timestamp: new Date().toLocaleString('ja-JP'),
-            messageId: messageId  // Add messageId for feedback tracking
+            messageId: messageId,  // Add messageId for feedback tracking
+            jobId: jobId  // 履歴テーブルのjob_id（フィードバックを直接更新するため）
         };
         
         this.chatMessages.push(message);
@@ -1614,6 +1629,11 @@ class KnowledgeQueryApp {
                 chat_session_id: this.chatSessionId  // Add chat_session_id
             };
             
+            const feedbackMessage = this.chatMessages.find(m => m.messageId === messageId);
+            if (feedbackMessage && feedbackMessage.jobId) {
+                payload.job_id = feedbackMessage.jobId;
+            }
+            
             if (rating !== null) {
                 payload.rating = rating;
             }
@@ -1854,7 +1874,7 @@ class HistorySidebarManager {
         this.elements.toggleBtn.addEventListener('click', () => this.toggleSidebar());
         
         // Refresh histories
-        this.elements.refreshBtn.addEventListener('click', () => this.loadHistories());
+        this.elements.refreshBtn.addEventListener('click', () => this.loadHistories(true));
         
         // Search
         this.elements.searchBtn.addEventListener('click', () => this.searchHistories());
@@ -1882,7 +1902,7 @@ class HistorySidebarManager {
         console.log('[toggleSidebar] Sidebar collapsed:', this.isCollapsed);
     }
     
-    async loadHistories() {
+    async loadHistories(refresh = false) {
         console.log('[loadHistories] Loading history summaries...');
         console.log('[loadHistories] apiEndpoint:', this.app.apiEndpoint);
         console.log('[loadHistories] chatSessionId:', this.app.chatSessionId);
@@ -1899,6 +1919,11 @@ class HistorySidebarManager {
                 requestBody.jobId = this.app.selectedJobId;
             }
             
+            // 更新ボタンからの再読み込みはサーバー側のキャッシュを使わない
+            if (refresh) {
+                requestBody.refresh = true;
+            }
+            
             console.log('[loadHistories] Request body:', JSON.stringify(requestBody));
             
             const response = await this.app.apiRequest(`${this.app.apiEndpoint}/history`, {
@@ -1959,7 +1984,7 @@ class HistorySidebarManager {
             const isActive = history.message_id === this.selectedHistoryMessageId;
             
             return `
-                <div class="history-item ${isActive ? 'active' : ''}" data-message-id="${history.message_id}">
+                <div class="history-item ${isActive ? 'active' : ''}" data-message-id="${history.message_id}" data-chat-session-id="${history.chat_session_id || ''}">
                     <div class="history-item-header">
                         <span class="history-item-time">${timeStr}</span>
                         <span class="history-item-count">${history.message_count}</span>
@@ -1980,13 +2005,15 @@ class HistorySidebarManager {
         document.querySelectorAll('.history-item').forEach(item => {
             item.addEventListener('click', () => {
                 const messageId = item.getAttribute('data-message-id');
-                this.loadHistoryDetail(messageId);
+                const historySessionId = item.getAttribute('data-chat-session-id');
+                this.loadHistoryDetail(messageId, historySessionId);
             });
             
             // Load preview content on hover
             item.addEventListener('mouseenter', () => {
                 const messageId = item.getAttribute('data-message-id');
-                this.loadHistoryPreview(messageId);
+                const historySessionId = item.getAttribute('data-chat-session-id');
+                this.loadHistoryPreview(messageId, historySessionId);
                 // Show preview
                 const preview = item.querySelector('.history-item-preview');
                 if (preview) {
@@ -2004,7 +2031,7 @@ class HistorySidebarManager {
         });
     }
     
-    async loadHistoryPreview(messageId) {
+    async loadHistoryPreview(messageId, historySessionId = null) {
         // Load the full conversation for preview
         const previewContainer = document.querySelector(`.history-preview-content[data-message-id="${messageId}"]`);
         if (!previewContainer) return;
@@ -2019,7 +2046,7 @@ class HistorySidebarManager {
                     'Content-Type': 'application/json'
                 },
                 body: JSON.stringify({
-                    chat_session_id: this.app.chatSessionId,
+                    chat_session_id: historySessionId || this.app.chatSessionId,  // 履歴のセッションID（GSIで直接取得）
                     action: 'get-history-detail',
                     message_id: messageId
                 })
@@ -2073,7 +2100,7 @@ class HistorySidebarManager {
         }
     }
     
-    async loadHistoryDetail(messageId) {
+    async loadHistoryDetail(messageId, historySessionId = null) {
         console.log('[loadHistoryDetail] Loading detail for message:', messageId);
         
         try {
@@ -2112,7 +2139,7 @@ class HistorySidebarManager {
                     'Content-Type': 'application/json'
                 },
                 body: JSON.stringify({
-                    chat_session_id: this.app.chatSessionId,
+                    chat_session_id: historySessionId || this.app.chatSessionId,  // 履歴のセッションID（GSIで直接取得）
                     message_id: messageId,
                     action: 'get-history-detail'
                 })